@@ -1,68 +1,202 @@
-import OpenGL.GL as GL
-import OpenGL.GLUT as GLUT
-import random
-import math
 import time
-
-# Window dimensions
-WINDOW_WIDTH = 900
-WINDOW_HEIGHT = 700
-
-# Game state
-score = 0
-lives = 3
-
-game_over_lives = False
-game_over_blocks = False
-difficulty = None
-
-# Stars
-stars = []
-num_stars = 130
-
-# Spaceship
-spaceship_x = WINDOW_WIDTH // 2
-spaceship_y = 50
-spaceship_width = 40
-spaceship_height = 30
-spaceship_speed = 13
-
-invincible = False
-invincible_start = 0
-
-# Bullets
-bullets = []
-bullet_speed = 15
-three_way_shoot = False
-three_way_shoot_start = 0
-
-# Blocks
-blocks = []
-block_sizes = [20, 30, 40]
-
-# Falling hearts
-falling_hearts = []
-heart_size = 17
-
-# Falling arrows
-falling_arrows = []
-arrow_size = 18
-
-# Power-ups
-power_ups = []
-power_up_size = 18
-
-# Difficulty settings
-difficulty_settings = {
-    "Easy": {"heart_speed": 3, "heart_spawn_rate": 0.003, "arrow_speed": 3, "arrow_spawn_rate": 0.03},
-    "Medium": {"heart_speed": 5, "heart_spawn_rate": 0.002, "arrow_speed": 5, "arrow_spawn_rate": 0.07},
-    "Hard": {"heart_speed": 6, "heart_spawn_rate": 0.001, "arrow_speed": 7, "arrow_spawn_rate": 0.1}
-}
+startup_start = time.perf_counter()  # Taken before the other imports, for the startup report
+import importlib
+import random
+import sys
+import os
+import atexit
+from array import array
+from collections import OrderedDict
+import numpy as np
+
+import profiler
+import replay
+import simulation as sim
+import software_render
+
+# PyOpenGL is only imported by load_gl(), called from main(), so loading this module
+# for its game logic or helpers does not pay for the GL and GLUT imports
+GL = None
+GLUT = None
+
+# Render backend: None draws with OpenGL; a software_render.Framebuffer takes the
+# batches instead (see use_software_backend), for rendering without a GPU or display
+backend = None
+
+# Startup timing: phase -> seconds, printed with --startup-report once the first frame is shown
+startup_phases = {}
+startup_report = False
+main_loop_started_at = None
+
+# Frame pacing
+target_fps = 60
+last_frame_time = None
+next_frame_time = None  # perf_counter() deadline of the next frame
+vsync = None  # None keeps the driver's setting, --vsync on/off overrides it
+frame_overruns = 0  # Frames whose work took longer than the frame budget
+
+# Adaptive quality: detail is dropped one level at a time while frames overrun their
+# budget and restored once there is headroom again. Levels are cumulative.
+adaptive_quality = True
+QUALITY_LEVELS = ("full", "fewer stars", "simple sprites", "frozen HUD")
+FEWER_STARS, SIMPLE_SPRITES, FROZEN_HUD = 1, 2, 3
+quality = 0
+slow_frames = 0  # Consecutive frames close to or over budget
+fast_frames = 0  # Consecutive frames with plenty of headroom
+degrade_after = 15  # Slow frames before dropping a level
+restore_after = 180  # Fast frames before restoring a level
+
+# Recording and replay (see replay.py)
+game_seed = None  # Seed for the next game, random unless given with --seed
+recording_path = None
+recorder = None
+replay_player = None
+replay_speed = 4.0  # Replayed game time per second of real time
+
+# Rendering
+batch_rendering = True  # Collect points per color and submit them with one glDrawArrays call
+point_batches = {}  # (r, g, b) -> array of x, y pairs, reused every frame
+quad_batches = {}  # (r, g, b) -> array of quad corners, four x, y pairs per rectangle
+current_batch = None
+current_color = (1.0, 1.0, 1.0)
+
+def set_color(r, g, b):
+    global current_batch, current_color
+    current_color = (r, g, b)
+    if batch_rendering:
+        color = current_color
+        current_batch = point_batches.get(color)
+        if current_batch is None:
+            current_batch = point_batches[color] = array('f')
+    else:
+        GL.glColor3f(r, g, b)
 
 def draw_pixel(x, y):
+    if batch_rendering:
+        current_batch.append(x)
+        current_batch.append(y)
+        return
     GL.glBegin(GL.GL_POINTS)
     GL.glVertex2f(x, y)
     GL.glEnd()
+    profiler.gl_calls += 3
+
+def draw_points(xs, ys):
+    # Plot many points at once from coordinate arrays
+    if batch_rendering:
+        current_batch.frombytes(np.column_stack((xs, ys)).astype(np.float32).tobytes())
+        return
+    for x, y in zip(xs.tolist(), ys.tolist()):
+        draw_pixel(x, y)
+
+def fill_rect(x, y, width, height):
+    # Fill the pixels x .. x + width - 1, y .. y + height - 1 with one quad
+    if batch_rendering:
+        # Quads are drawn before points in a flush, so points already queued (stars under the
+        # blocks, the HUD heart under the health bar) go out first to keep the layer order
+        if any(point_batches.values()) or any(sprite_instances.values()):
+            flush_batches()
+        batch = quad_batches.get(current_color)
+        if batch is None:
+            batch = quad_batches[current_color] = array('f')
+        batch.extend((x, y, x + width, y, x + width, y + height, x, y + height))
+        return
+    GL.glBegin(GL.GL_QUADS)
+    GL.glVertex2f(x, y)
+    GL.glVertex2f(x + width, y)
+    GL.glVertex2f(x + width, y + height)
+    GL.glVertex2f(x, y + height)
+    GL.glEnd()
+    profiler.gl_calls += 6
+
+def fill_rect_points(x, y, width, height):
+    # Reference path: plot the same rectangle one point at a time
+    for py in range(y, y + height):
+        for px in range(x, x + width):
+            draw_pixel(px, py)
+
+def flush_batches():
+    # Submit every color group collected this frame, one draw call per color
+    flush_sprites()
+    if backend is not None:
+        for color, batch in quad_batches.items():
+            if batch:
+                backend.quads(color, np.frombuffer(batch, dtype=np.float32).reshape(-1, 8))
+                del batch[:]
+        for color, batch in point_batches.items():
+            if batch:
+                backend.points(color, np.frombuffer(batch, dtype=np.float32).reshape(-1, 2))
+                del batch[:]
+        return
+    GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+    for color, batch in quad_batches.items():
+        if batch:
+            GL.glColor3f(*color)
+            GL.glVertexPointer(2, GL.GL_FLOAT, 0, batch.tobytes())
+            GL.glDrawArrays(GL.GL_QUADS, 0, len(batch) // 2)
+            del batch[:]
+            profiler.gl_calls += 3
+    for color, batch in point_batches.items():
+        if batch:
+            GL.glColor3f(*color)
+            GL.glVertexPointer(2, GL.GL_FLOAT, 0, batch.tobytes())
+            GL.glDrawArrays(GL.GL_POINTS, 0, len(batch) // 2)
+            del batch[:]
+            profiler.gl_calls += 3
+    GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+
+def toggle_batch_rendering():
+    global batch_rendering
+    flush_batches()
+    batch_rendering = not batch_rendering
+    print("Batch rendering:", "on" if batch_rendering else "off")
+
+# Text cache: each distinct string is compiled once into a display list
+text_cache = OrderedDict()  # (text, font) -> display list id, least recently used first
+text_cache_size = 64
+pinned_texts = set()  # Keys of lists the frozen HUD calls from inside hud_layer, never evicted
+
+def text_display_list(text, font):
+    key = (text, font)
+    display_list = text_cache.get(key)
+    if display_list is not None:
+        text_cache.move_to_end(key)
+        return display_list
+
+    display_list = GL.glGenLists(1)
+    GL.glNewList(display_list, GL.GL_COMPILE)
+    for char in text:
+        GLUT.glutBitmapCharacter(font, ord(char))
+    GL.glEndList()
+    profiler.gl_calls += len(text) + 3
+    text_cache[key] = display_list
+
+    # Strings that stopped showing up (old scores) fall out first
+    if len(text_cache) > text_cache_size:
+        evicted = next(key for key in text_cache if key not in pinned_texts)
+        GL.glDeleteLists(text_cache.pop(evicted), 1)
+    return display_list
+
+def text_color(r, g, b):
+    if backend is None:
+        GL.glColor3f(r, g, b)
+
+def draw_text(x, y, text, font=None, cached=True):
+    # The raster position and color are set outside the list, so one list serves any place or color.
+    # Text that changes every frame (cached=False) is drawn directly, compiling it would cost more
+    # than drawing it and push the steady strings out of the cache.
+    if backend is not None:
+        return  # GLUT's bitmap fonts have no software equivalent, frames are rendered without text
+    if font is None:
+        font = GLUT.GLUT_BITMAP_TIMES_ROMAN_24
+    GL.glRasterPos2f(x, y)
+    if cached:
+        GL.glCallList(text_display_list(text, font))
+        profiler.gl_calls += 2
+        return
+    for char in text:
+        GLUT.glutBitmapCharacter(font, ord(char))
+    profiler.gl_calls += len(text) + 1
 
 def midpoint_line(x1, y1, x2, y2):
     dx = abs(x2 - x1)
@@ -106,7 +240,7 @@ def midpoint_circle(xc, yc, r):
         x += 1
 
 def draw_heart(x, y, size):
-    GL.glColor3f(1.0, 0.0, 0.0)  # Red color for hearts
+    set_color(1.0, 0.0, 0.0)  # Red color for hearts
 
     # Draw two circles for the top of the heart
     midpoint_circle(x - size // 4, y, size // 4)
@@ -118,207 +252,185 @@ def draw_heart(x, y, size):
 
 def draw_arrow(x, y, size):
     # Arrow body (elongated diamond shape, flipped vertically)
-    GL.glColor3f(1.0, 1.0, 0.0)  # Yellow color for the mini spaceship-like arrow
+    set_color(1.0, 1.0, 0.0)  # Yellow color for the mini spaceship-like arrow
     midpoint_line(x, y, x - size // 2, y - size // 2)  # Left wing
     midpoint_line(x, y, x + size // 2, y - size // 2)  # Right wing
     midpoint_line(x - size // 2, y - size // 2, x, y - size)  # Left edge to bottom
     midpoint_line(x + size // 2, y - size // 2, x, y - size)  # Right edge to bottom
 
     # Cockpit
-    GL.glColor3f(0.0, 1.0, 1.0)  # Cyan color for cockpit
+    set_color(0.0, 1.0, 1.0)  # Cyan color for cockpit
     midpoint_circle(x, y - size // 3, size // 6)
 
     # Thrusters
-    GL.glColor3f(1.0, 0.0, 0.0)  # Red for thrusters' base
+    set_color(1.0, 0.0, 0.0)  # Red for thrusters' base
     midpoint_circle(x - size // 4, y + size // 6, size // 8)
     midpoint_circle(x + size // 4, y + size // 6, size // 8)
 
     # Flames
-    GL.glColor3f(1.0, 0.5, 0.0)  # Orange flames
+    set_color(1.0, 0.5, 0.0)  # Orange flames
     midpoint_line(x - size // 4, y + size // 6, x - size // 4, y + size // 4)
     midpoint_line(x + size // 4, y + size // 6, x + size // 4, y + size // 4)
 
-    GL.glColor3f(1.0, 1.0, 0.0)  # Yellow flames
+    set_color(1.0, 1.0, 0.0)  # Yellow flames
     midpoint_line(x - size // 5, y + size // 4, x - size // 4, y + size // 6)
     midpoint_line(x + size // 5, y + size // 4, x + size // 4, y + size // 6)
     
-def init_stars():
-    global stars
-    stars = [{'x': random.randint(0, WINDOW_WIDTH), 'y': random.randint(0, WINDOW_HEIGHT)} for _ in range(num_stars)]
-
-def init_game():
-    global blocks, falling_hearts, falling_arrows, power_ups
-    blocks = []
-    falling_hearts = []
-    falling_arrows = []
-    power_ups = []
-    init_stars()
-
-    # Define restricted areas (top-left and top-right)
-    heart_bar_width = 90  # Approximate width of the heart icon and health bar
-    score_area_width = 150  # Approximate width of the score area
-    min_distance_between_blocks = 50  # Minimum distance to ensure blocks don't overlap
-
-    # Initialize blocks with different sizes
-    for _ in range(20):
-        block_size = random.choice(block_sizes)
-
-        # Ensure blocks don't spawn in restricted areas
-        while True:
-            # Generate random position for the block1
-            block_x = random.randint(0, WINDOW_WIDTH - block_size)
-            block_y = random.randint(WINDOW_HEIGHT // 2, WINDOW_HEIGHT - block_size)
-
-            # Ensure no overlap with existing blocks
-            overlap = False
-            for block in blocks:
-                dist_x = abs(block['x'] - block_x)
-                dist_y = abs(block['y'] - block_y)
-                if dist_x < block_size + min_distance_between_blocks and dist_y < block_size + min_distance_between_blocks:
-                    overlap = True
-                    break  # Exit the loop if overlap is detected
-
-            if not overlap:
-                # No overlap, so we can place the block
-                blocks.append({'x': block_x, 'y': block_y, 'size': block_size})
-                break  # Exit while loop and move to next block
-
-def check_collisions():
-    global score, lives, game_over_lives, game_over_blocks, invincible, invincible_start
-
-    # Check bullet-block collisions
-    for bullet in bullets[:]:
-        for block in blocks[:]:
-            if (block['x'] < bullet['x'] < block['x'] + block['size'] and
-                block['y'] < bullet['y'] < block['y'] + block['size']):
-                bullets.remove(bullet)
-                blocks.remove(block)
-                score += 1  # Increase score when hitting blocks
-                if not blocks:
-                    game_over_blocks = True
-
-    # Check spaceship-heart collisions
-    for heart in falling_hearts[:]:
-        if (spaceship_x < heart['x'] < spaceship_x + spaceship_width and
-            spaceship_y < heart['y'] < spaceship_y + spaceship_height):
-            falling_hearts.remove(heart)
-            lives += 1  # Increase lives when collecting hearts
-
-    # Check spaceship-power-up collisions
-    for power_up in power_ups[:]:
-        if (spaceship_x < power_up['x'] < spaceship_x + spaceship_width and
-            spaceship_y < power_up['y'] < spaceship_y + spaceship_height):
-            power_ups.remove(power_up)
-            apply_power_up()
-
-    # Check spaceship-arrow collisions
-    for arrow in falling_arrows[:]:
-        if invincible:
-            shield_radius = spaceship_width
-            shield_center_x = spaceship_x + spaceship_width // 2
-            shield_center_y = spaceship_y + spaceship_height // 2
-            distance = math.sqrt((arrow['x'] - shield_center_x) ** 2 + (arrow['y'] - shield_center_y) ** 2)
-            if distance < shield_radius:
-                falling_arrows.remove(arrow)
-        else:
-            if (spaceship_x < arrow['x'] < spaceship_x + spaceship_width and
-                spaceship_y < arrow['y'] < spaceship_y + spaceship_height):
-                falling_arrows.remove(arrow)
-                lives -= 1
-                if lives <= 0:
-                    game_over_lives = True
+def draw_spaceship(x, y, size):
+    set_color(0.7, 0.7, 0.7)  # Light Gray/Blue for main body
 
-    
-    
-def restart_game():
-    global score, lives, three_way_shoot, three_way_shoot_start, game_over_lives, game_over_blocks
-    score = 0
-    lives = 3
-    game_over_lives = False
-    game_over_blocks = False
-    three_way_shoot = False
-    three_way_shoot_start = 0
-    init_game()
-
-def update_game_objects():
-    global three_way_shoot, three_way_shoot_start, invincible, invincible_start
-    
-    # Update star positions
-    for star in stars:
-        star['y'] -= 2  # Adjust the speed of falling stars
-        if star['y'] < 0:
-            star['y'] = WINDOW_HEIGHT
-            star['x'] = random.randint(0, WINDOW_WIDTH)
-            
-    # Update bullet positions
-    for bullet in bullets:
-        angle_rad = math.radians(bullet['angle'])
-        bullet['x'] += math.sin(angle_rad) * bullet_speed
-        bullet['y'] += math.cos(angle_rad) * bullet_speed
-
-    # Update falling heart positions
-    for heart in falling_hearts:
-        heart['y'] -= difficulty_settings[difficulty]["heart_speed"]
-
-    # Update falling arrow positions
-    for arrow in falling_arrows:
-        arrow['y'] -= difficulty_settings[difficulty]["arrow_speed"]
-
-    # Update power-up positions
-    for power_up in power_ups:
-        power_up['y'] -= 5
-
-    # Remove off-screen objects
-    bullets[:] = [b for b in bullets if b['y'] < WINDOW_HEIGHT]
-    falling_hearts[:] = [h for h in falling_hearts if h['y'] > 0]
-    falling_arrows[:] = [a for a in falling_arrows if a['y'] > 0]
-    power_ups[:] = [p for p in power_ups if p['y'] > 0]
-
-    # Check if three-way shoot should end
-    if three_way_shoot and time.time() - three_way_shoot_start > 10:
-        three_way_shoot = False
-        
-    # Check if invincibility should
-    if invincible and time.time() - invincible_start > 10:
-        invincible = False
-
-def spawn_falling_hearts():
-    if random.random() < difficulty_settings[difficulty]["heart_spawn_rate"]:
-        falling_hearts.append({
-            'x': random.randint(0, WINDOW_WIDTH),
-            'y': WINDOW_HEIGHT
-        })
-
-def spawn_falling_arrows():
-    if random.random() < difficulty_settings[difficulty]["arrow_spawn_rate"]:
-        falling_arrows.append({
-            'x': random.randint(0, WINDOW_WIDTH),
-            'y': WINDOW_HEIGHT
-        })
-
-def spawn_power_ups():
-    if random.random() < 0.003:  # Reduced spawn rate for power-ups
-        power_ups.append({
-            'x': random.randint(0, WINDOW_WIDTH),
-            'y': WINDOW_HEIGHT
-        })
-
-def check_game_over():
-    global game_over_lives, game_over_blocks
-    if lives <= 0:
-        game_over_lives = True
-
-    if not blocks:
-        game_over_blocks = True
+    # Central elongated body
+    midpoint_line(x + size // 2, y + sim.spaceship_height, x + size // 2, y)
+
+    # Cockpit area
+    set_color(1.0, 1.0, 1.0)  # White or Light Gray for cockpit
+    midpoint_circle(x + size // 2, y + 3 * sim.spaceship_height // 4, 5)
+
+    # Wings
+    set_color(0.7, 0.7, 0.7)  # Light Gray/Blue for wings
+    midpoint_line(x, y + sim.spaceship_height // 2, x + size // 4, y)
+    midpoint_line(x + size, y + sim.spaceship_height // 2, x + 3 * size // 4, y)
+
+    # Add darker accents to the wings for texture
+    set_color(0.3, 0.3, 0.3)  # Dark Gray/Black accents
+    midpoint_line(x, y + sim.spaceship_height // 2, x + size // 4, y + sim.spaceship_height // 4)
+    midpoint_line(x + size, y + sim.spaceship_height // 2, x + 3 * size // 4, y + sim.spaceship_height // 4)
+
+    # Thrusters
+    set_color(0.3, 0.3, 0.3)  # Black for thruster base
+    midpoint_circle(x + size // 3, y - 5, 3)
+    midpoint_circle(x + 2 * size // 3, y - 5, 3)
+
+    # Flames
+    set_color(1.0, 0.0, 0.0)  # Red for flame base
+    midpoint_circle(x + size // 3, y - 10, 2)
+    midpoint_circle(x + 2 * size // 3, y - 10, 2)
+    set_color(1.0, 0.5, 0.0)  # Orange for middle of flames
+    midpoint_circle(x + size // 3, y - 12, 1)
+    midpoint_circle(x + 2 * size // 3, y - 12, 1)
+    set_color(1.0, 1.0, 0.0)  # Yellow for tip of flames
+    draw_pixel(x + size // 3, y - 14)
+    draw_pixel(x + 2 * size // 3, y - 14)
+
+def draw_bullet(x, y, size):
+    set_color(1.0, 1.0, 0.0)
+    midpoint_line(x, y, x, y + size)
+
+def draw_arrow_simple(x, y, size):
+    # Cheap arrow for reduced quality: the outline without cockpit, thrusters or flames
+    set_color(1.0, 1.0, 0.0)
+    midpoint_line(x, y, x - size // 2, y - size // 2)
+    midpoint_line(x, y, x + size // 2, y - size // 2)
+    midpoint_line(x - size // 2, y - size // 2, x, y - size)
+    midpoint_line(x + size // 2, y - size // 2, x, y - size)
+
+def draw_power_up_simple(x, y, size):
+    # Cheap power-up for reduced quality: the outer ring only
+    set_color(1.0, 0.4, 0.7)
+    midpoint_circle(x, y, size // 2)
+
+def draw_power_up(x, y, size):
+    # Draw the outer deep pink circle
+    set_color(1.0, 0.4, 0.7)  # Deep Pink
+    midpoint_circle(x, y, size // 2)
+
+    # Draw the next layer, transitioning to a lighter pink hue
+    set_color(1.0, 0.6, 0.8)  # Lighter Pink Hue
+    midpoint_circle(x, y, size // 3)
+
+    # Draw the center of the ball, a very light pink
+    set_color(1.0, 0.8, 0.9)  # Very Light Pink Center
+    midpoint_circle(x, y, size // 4)
+
+    # Add subtle white highlight to create a reflective shine
+    set_color(1.0, 1.0, 1.0)  # White Highlight
+    midpoint_circle(x - size // 8, y + size // 8, size // 8)
+
+# Sprite cache: each shape is rasterized once into relative offsets per color
+sprite_draw_functions = {
+    "spaceship": draw_spaceship,
+    "heart": draw_heart,
+    "arrow": draw_arrow,
+    "power_up": draw_power_up,
+    "bullet": draw_bullet,
+    "arrow_simple": draw_arrow_simple,
+    "power_up_simple": draw_power_up_simple,
+}
+sprite_cache = {}  # (shape, size) -> list of (color, N x 2 offsets)
+sprite_instances = {}  # (shape, size) -> list of N x 2 position arrays queued this frame
+sprite_cache_hits = 0
+sprite_cache_misses = 0
+
+def rasterize_sprite(shape, size):
+    # Run the shape's draw function once at the origin and capture its points per color
+    global batch_rendering, point_batches, current_batch
+    saved = (batch_rendering, point_batches, current_batch)
+    batch_rendering = True
+    point_batches = {}
+    try:
+        sprite_draw_functions[shape](0, 0, size)
+        sprite = [(color, np.frombuffer(points, dtype=np.float32).reshape(-1, 2).copy())
+                  for color, points in point_batches.items() if points]
+    finally:
+        batch_rendering, point_batches, current_batch = saved
+    return sprite
+
+def get_sprite(shape, size):
+    global sprite_cache_hits, sprite_cache_misses
+    key = (shape, size)
+    sprite = sprite_cache.get(key)
+    if sprite is None:
+        sprite_cache_misses += 1
+        sprite = sprite_cache[key] = rasterize_sprite(shape, size)
+    else:
+        sprite_cache_hits += 1
+    return sprite
+
+def draw_sprite(shape, x, y, size):
+    draw_sprites(shape, np.array([x], dtype=np.float32), np.array([y], dtype=np.float32), size)
+
+def draw_sprites(shape, xs, ys, size):
+    # Draw one instance of the sprite at every (xs[i], ys[i])
+    if len(xs) == 0:
+        return
+    sprite = get_sprite(shape, size)
+    if batch_rendering:
+        # Translated all at once in flush_sprites
+        positions = sprite_instances.get((shape, size))
+        if positions is None:
+            positions = sprite_instances[(shape, size)] = []
+        positions.append(np.column_stack((xs, ys)).astype(np.float32))
+    else:
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            for color, offsets in sprite:
+                set_color(*color)
+                for dx, dy in offsets.tolist():
+                    draw_pixel(x + dx, y + dy)
+
+def flush_sprites():
+    # Add every queued instance to the color batches as cached offsets + position
+    for key, positions in sprite_instances.items():
+        if not positions:
+            continue
+        origins = np.concatenate(positions)
+        for color, offsets in sprite_cache[key]:
+            points = offsets[np.newaxis, :, :] + origins[:, np.newaxis, :]
+            batch = point_batches.get(color)
+            if batch is None:
+                batch = point_batches[color] = array('f')
+            batch.frombytes(points.tobytes())
+        positions.clear()
+
+def sprite_cache_stats():
+    return {"sprites": len(sprite_cache), "hits": sprite_cache_hits, "misses": sprite_cache_misses}
 
 def update_score_and_lives():
-    global score, lives
-    GL.glColor3f(1.0, 1.0, 1.0)
+    text_color(1.0, 1.0, 1.0)
 
     # Draw the heart icon at the top left
     heart_x = 10
-    heart_y = WINDOW_HEIGHT - 20  # Set the vertical position of the heart icon
-    draw_heart(heart_x, heart_y, 15)  # Adjust size as needed
+    heart_y = sim.WINDOW_HEIGHT - 20  # Set the vertical position of the heart icon
+    draw_sprite("heart", heart_x, heart_y, 15)  # Adjust size as needed
 
     # Draw the health bar segments to the right of the heart
     segment_width = 30  # Width of each health segment
@@ -328,190 +440,479 @@ def update_score_and_lives():
     start_y = heart_y  # Align the health bar's height with the heart's height
 
     # Determine the number of filled segments based on remaining lives
-    for i in range(lives):
+    for i in range(sim.game.lives):
         segment_x = start_x + i * (segment_width + segment_gap)
 
-        if i < lives:
-            GL.glColor3f(1.0, 0.0, 0.0)  # Red color for filled segments
+        if i < sim.game.lives:
+            set_color(1.0, 0.0, 0.0)  # Red color for filled segments
         else:
-            GL.glColor3f(1.0, 1.0, 1.0)  # White color for empty segments
+            set_color(1.0, 1.0, 1.0)  # White color for empty segments
 
-        # Draw the segment as individual points using GL_POINTS
-        for y in range(start_y - segment_height // 2, start_y + segment_height // 2):
-            for x in range(segment_x, segment_x + segment_width):
-                draw_pixel(x, y)
+        # Draw the segment as a single filled rectangle
+        fill_rect(segment_x, start_y - segment_height // 2, segment_width, segment_height)
 
     # Set color to white for the score text
-    GL.glColor3f(1.0, 1.0, 1.0)
+    text_color(1.0, 1.0, 1.0)
 
     # Draw the score at the top right of the screen, away from the health bar
-    score_x = WINDOW_WIDTH - 150  # Position near the top-right corner
-    score_y = WINDOW_HEIGHT - 25  # Align vertically with the health bar
-    GL.glRasterPos2f(score_x, score_y)
-    for char in f"Score: {score}":
-        GLUT.glutBitmapCharacter(GLUT.GLUT_BITMAP_TIMES_ROMAN_24, ord(char))
+    score_x = sim.WINDOW_WIDTH - 150  # Position near the top-right corner
+    score_y = sim.WINDOW_HEIGHT - 25  # Align vertically with the health bar
+    score_text, power_up_text = hud_texts()
+    draw_text(score_x, score_y, score_text)
 
     # Draw the active power-up indicator
     power_up_x = score_x - 100
     power_up_y = 15  # Position below the score
-    GL.glRasterPos2f(power_up_x, power_up_y)
-    if invincible:
+    draw_text(power_up_x, power_up_y, power_up_text)
+
+def hud_texts():
+    if sim.game.invincible:
         power_up_text = "Power-Up: Invincible"
-    elif three_way_shoot:
+    elif sim.game.three_way_shoot:
         power_up_text = "Power-Up: Bullet Spread"
     else:
         power_up_text = "Power-Up: None"
-    
-    for char in power_up_text:
-        GLUT.glutBitmapCharacter(GLUT.GLUT_BITMAP_TIMES_ROMAN_24, ord(char))
-
+    return f"Score: {sim.game.score}", power_up_text
+
+# Frozen HUD (adaptive quality): the HUD is compiled into a display list and redrawn
+# from it, refreshing its contents only every hud_refresh_interval seconds
+hud_layer = None
+hud_refreshed_at = None
+hud_refresh_interval = 0.5
+
+def draw_hud():
+    global hud_layer, hud_refreshed_at, batch_rendering, current_batch, current_color
+    if quality < FROZEN_HUD:
+        hud_refreshed_at = None
+        pinned_texts.clear()
+        update_score_and_lives()
+        return
+
+    now = time.perf_counter()
+    if hud_refreshed_at is None or now - hud_refreshed_at >= hud_refresh_interval:
+        # Text lists must exist before compiling, display lists cannot be created inside one.
+        # hud_layer calls them by id, so they stay pinned in the cache until it is recompiled.
+        pinned_texts.clear()
+        pinned_texts.update((text, GLUT.GLUT_BITMAP_TIMES_ROMAN_24) for text in hud_texts())
+        for text, font in pinned_texts:
+            text_display_list(text, font)
+        if hud_layer is None:
+            hud_layer = GL.glGenLists(1)
+        # Compiled in immediate mode, batched points would only be submitted outside the list
+        saved = (batch_rendering, current_batch, current_color)
+        batch_rendering = False
+        GL.glNewList(hud_layer, GL.GL_COMPILE)
+        try:
+            update_score_and_lives()
+        finally:
+            GL.glEndList()
+            batch_rendering, current_batch, current_color = saved
+        hud_refreshed_at = now
+    GL.glCallList(hud_layer)
+    profiler.gl_calls += 1
+
+
+# Static layers: compiled into display lists and rebuilt only when their contents change
+layer_caching = True
+starfield_layer = None
+starfield_layer_version = None
+block_layer = None
+block_layer_version = None
+
+def toggle_layer_caching():
+    global layer_caching
+    layer_caching = not layer_caching
+    print("Layer caching:", "on" if layer_caching else "off")
+
+def draw_starfield():
+    global starfield_layer, starfield_layer_version
+    # Reduced quality draws half the stars; sim.num_stars stays, it decides the random stream
+    count = sim.num_stars // 2 if quality >= FEWER_STARS else sim.num_stars
+    if not layer_caching:
+        set_color(1.0, 1.0, 1.0)  # White color for stars
+        xs, ys = sim.star_positions(sim.game.render_alpha)
+        draw_points(xs[:count], ys[:count])
+        return
+
+    if starfield_layer_version != (sim.game.stars_version, count):
+        if starfield_layer is None:
+            starfield_layer = GL.glGenLists(1)
+        GL.glNewList(starfield_layer, GL.GL_COMPILE)
+        GL.glColor3f(1.0, 1.0, 1.0)  # White color for stars
+        GL.glBegin(GL.GL_POINTS)
+        for x, y in zip(sim.game.star_x[:count].tolist(), sim.game.star_y[:count].tolist()):
+            GL.glVertex2f(x, y)
+        GL.glEnd()
+        GL.glEndList()
+        starfield_layer_version = (sim.game.stars_version, count)
+
+    # Draw the pattern twice so the part scrolled off the bottom shows up at the top
+    GL.glPushMatrix()
+    GL.glTranslatef(0.0, -sim.star_scroll_at(sim.game.render_alpha), 0.0)
+    GL.glCallList(starfield_layer)
+    GL.glTranslatef(0.0, sim.WINDOW_HEIGHT, 0.0)
+    GL.glCallList(starfield_layer)
+    GL.glPopMatrix()
+    profiler.gl_calls += 6
+
+def draw_blocks():
+    global block_layer, block_layer_version
+    scroll = sim.field_scroll_at(sim.game.render_alpha)  # Blocks are in field coordinates, see sim.game.endless
+    if not layer_caching:
+        set_color(0.8, 0.3, 0.1)  # Set the color to a brick-like reddish-brown
+        for block in sim.game.blocks:
+            # Block edges are inclusive, so the filled area is size + 1 pixels wide
+            fill_rect(block['x'], block['y'] - scroll, block['size'] + 1, block['size'] + 1)
+        return
+
+    # Blocks only change when one is placed or destroyed
+    if block_layer_version != sim.game.blocks_version:
+        if block_layer is None:
+            block_layer = GL.glGenLists(1)
+        GL.glNewList(block_layer, GL.GL_COMPILE)
+        GL.glColor3f(0.8, 0.3, 0.1)  # Set the color to a brick-like reddish-brown
+        GL.glBegin(GL.GL_QUADS)
+        for block in sim.game.blocks:
+            x, y, size = block['x'], block['y'], block['size'] + 1
+            GL.glVertex2f(x, y)
+            GL.glVertex2f(x + size, y)
+            GL.glVertex2f(x + size, y + size)
+            GL.glVertex2f(x, y + size)
+        GL.glEnd()
+        GL.glEndList()
+        block_layer_version = sim.game.blocks_version
+    if scroll:
+        GL.glPushMatrix()
+        GL.glTranslatef(0.0, -scroll, 0.0)
+        GL.glCallList(block_layer)
+        GL.glPopMatrix()
+        profiler.gl_calls += 4
+    else:
+        GL.glCallList(block_layer)
+        profiler.gl_calls += 1
 
 def draw_game_objects():
     
-    GL.glColor3f(1.0, 1.0, 1.0)  # White color for stars
-    for star in stars:
-        draw_pixel(star['x'], star['y'])
+    draw_starfield()
     
-    # Draw spaceship with updated design
-    GL.glColor3f(0.7, 0.7, 0.7)  # Light Gray/Blue for main body
-
-    # Central elongated body
-    midpoint_line(spaceship_x + spaceship_width // 2, spaceship_y + spaceship_height, spaceship_x + spaceship_width // 2, spaceship_y)
-
-    # Cockpit area
-    GL.glColor3f(1.0, 1.0, 1.0)  # White or Light Gray for cockpit
-    midpoint_circle(spaceship_x + spaceship_width // 2, spaceship_y + 3 * spaceship_height // 4, 5)
+    # Draw spaceship with updated design, blended between ticks like everything else
+    spaceship_x = sim.spaceship_x_at(sim.game.render_alpha)
+    draw_sprite("spaceship", spaceship_x, sim.spaceship_y, sim.spaceship_width)
 
-    # Wings
-    GL.glColor3f(0.7, 0.7, 0.7)  # Light Gray/Blue for wings
-    midpoint_line(spaceship_x, spaceship_y + spaceship_height // 2, spaceship_x + spaceship_width // 4, spaceship_y)
-    midpoint_line(spaceship_x + spaceship_width, spaceship_y + spaceship_height // 2, spaceship_x + 3 * spaceship_width // 4, spaceship_y)
-
-    # Add darker accents to the wings for texture
-    GL.glColor3f(0.3, 0.3, 0.3)  # Dark Gray/Black accents
-    midpoint_line(spaceship_x, spaceship_y + spaceship_height // 2, spaceship_x + spaceship_width // 4, spaceship_y + spaceship_height // 4)
-    midpoint_line(spaceship_x + spaceship_width, spaceship_y + spaceship_height // 2, spaceship_x + 3 * spaceship_width // 4, spaceship_y + spaceship_height // 4)
-
-    # Thrusters
-    GL.glColor3f(0.3, 0.3, 0.3)  # Black for thruster base
-    midpoint_circle(spaceship_x + spaceship_width // 3, spaceship_y - 5, 3)
-    midpoint_circle(spaceship_x + 2 * spaceship_width // 3, spaceship_y - 5, 3)
-
-    # Flames
-    GL.glColor3f(1.0, 0.0, 0.0)  # Red for flame base
-    midpoint_circle(spaceship_x + spaceship_width // 3, spaceship_y - 10, 2)
-    midpoint_circle(spaceship_x + 2 * spaceship_width // 3, spaceship_y - 10, 2)
-    GL.glColor3f(1.0, 0.5, 0.0)  # Orange for middle of flames
-    midpoint_circle(spaceship_x + spaceship_width // 3, spaceship_y - 12, 1)
-    midpoint_circle(spaceship_x + 2 * spaceship_width // 3, spaceship_y - 12, 1)
-    GL.glColor3f(1.0, 1.0, 0.0)  # Yellow for tip of flames
-    draw_pixel(spaceship_x + spaceship_width // 3, spaceship_y - 14)
-    draw_pixel(spaceship_x + 2 * spaceship_width // 3, spaceship_y - 14)
-    
-    if invincible:
-        GL.glColor3f(0.0, 1.0, 1.0)  # Cyan color for shield
-        midpoint_circle(spaceship_x + spaceship_width // 2, spaceship_y + spaceship_height // 2, spaceship_width)
+    if sim.game.invincible:
+        set_color(0.0, 1.0, 1.0)  # Cyan color for shield
+        midpoint_circle(spaceship_x + sim.spaceship_width // 2, sim.spaceship_y + sim.spaceship_height // 2, sim.spaceship_width)
     
     # Draw bullets
-    GL.glColor3f(1.0, 1.0, 0.0)
-    for bullet in bullets:
-        midpoint_line(bullet['x'], bullet['y'], bullet['x'], bullet['y'] + 5)
+    bullets = sim.game.entities.indices(sim.BULLET)
+    draw_sprites("bullet", *sim.game.entities.positions(bullets, sim.game.render_alpha), sim.bullet_length)
 
-    GL.glColor3f(0.8, 0.3, 0.1)  # Set the color to a brick-like reddish-brown
-
-    for block in blocks:
-        # Loop through each y-coordinate in the block to simulate filling
-        for y in range(block['y'], block['y'] + block['size'] + 1):
-            # Draw a horizontal line across the width of the block
-            midpoint_line(block['x'], y, block['x'] + block['size'], y)
+    draw_blocks()
 
     # Draw falling hearts
-    for heart in falling_hearts:
-        draw_heart(heart['x'], heart['y'], heart_size)
+    hearts = sim.game.entities.indices(sim.HEART)
+    draw_sprites("heart", *sim.game.entities.positions(hearts, sim.game.render_alpha), sim.heart_size)
 
-    # Draw falling arrows
-    for arrow in falling_arrows:
-        draw_arrow(arrow['x'], arrow['y'], arrow_size)
+    # Draw falling arrows and power-ups, as plain outlines when quality is reduced
+    simple = "_simple" if quality >= SIMPLE_SPRITES else ""
+    arrows = sim.game.entities.indices(sim.ARROW)
+    draw_sprites("arrow" + simple, *sim.game.entities.positions(arrows, sim.game.render_alpha), sim.arrow_size)
 
     # Draw power-ups
-    for power_up in power_ups:
-        # Draw the outer deep pink circle
-        GL.glColor3f(1.0, 0.4, 0.7)  # Deep Pink
-        midpoint_circle(power_up['x'], power_up['y'], power_up_size // 2)
-
-        # Draw the next layer, transitioning to a lighter pink hue
-        GL.glColor3f(1.0, 0.6, 0.8)  # Lighter Pink Hue
-        midpoint_circle(power_up['x'], power_up['y'], power_up_size // 3)
-
-        # Draw the center of the ball, a very light pink
-        GL.glColor3f(1.0, 0.8, 0.9)  # Very Light Pink Center
-        midpoint_circle(power_up['x'], power_up['y'], power_up_size // 4)
-
-        # Add subtle white highlight to create a reflective shine
-        GL.glColor3f(1.0, 1.0, 1.0)  # White Highlight
-        midpoint_circle(power_up['x'] - power_up_size // 8, power_up['y'] + power_up_size // 8, power_up_size // 8)
- 
-def apply_power_up():
-    global three_way_shoot, three_way_shoot_start, invincible, invincible_start
-    power_up = random.choice(["three_way_shoot", "invincible"])
-    if power_up == "three_way_shoot":
-        three_way_shoot = True
-        three_way_shoot_start = time.time()
-    elif power_up == "invincible":
-        invincible = True
-        invincible_start = time.time()
-
-def shoot_bullet():
-    global three_way_shoot
-    if three_way_shoot:
-        bullets.append({'x': spaceship_x + spaceship_width // 2, 'y': spaceship_y + spaceship_height, 'angle': 0})
-        bullets.append({'x': spaceship_x + spaceship_width // 2, 'y': spaceship_y + spaceship_height, 'angle': -15})
-        bullets.append({'x': spaceship_x + spaceship_width // 2, 'y': spaceship_y + spaceship_height, 'angle': 15})
-    else:
-        bullets.append({'x': spaceship_x + spaceship_width // 2, 'y': spaceship_y + spaceship_height, 'angle': 0})
+    power_ups = sim.game.entities.indices(sim.POWER_UP)
+    draw_sprites("power_up" + simple, *sim.game.entities.positions(power_ups, sim.game.render_alpha), sim.power_up_size)
 
-def keyboard(key, x, y):
-    global spaceship_x, game_over_lives, game_over_blocks, difficulty
+held_keys = {b'a': "left", b'd': "right", b' ': "fire"}
 
-    if difficulty is None:
+def keyboard(key, x, y):
+    if key == b'b':
+        toggle_batch_rendering()
+    elif key == b'l':
+        toggle_layer_caching()
+    elif key == b'p':
+        profiler.toggle()
+    elif key == b'q':
+        toggle_adaptive_quality()
+    elif replay_player is not None:
+        return  # Gameplay input comes from the recording
+    elif sim.game.difficulty is None:
         if key == b'1':
-            difficulty = "Easy"
-            init_game()
+            start_game("Easy")
         elif key == b'2':
-            difficulty = "Medium"
-            init_game()
+            start_game("Medium")
         elif key == b'3':
-            difficulty = "Hard"
-            init_game()
-    else:
-        if key == b'a' and spaceship_x > 0:
-            spaceship_x -= spaceship_speed
-        elif key == b'd' and spaceship_x < WINDOW_WIDTH - spaceship_width:
-            spaceship_x += spaceship_speed
-        elif key == b' ':
-            shoot_bullet()
-        elif key == b'r' and (game_over_lives or game_over_blocks):
-            restart_game()
+            start_game("Hard")
+    elif key in held_keys:
+        # Movement and firing happen in the simulation tick while the key is held
+        press(held_keys[key], True)
+    elif key == b'r' and (sim.game.game_over_lives or sim.game.game_over_blocks):
+        if recorder is not None:
+            recorder.restart()
+        sim.restart_game()
+
+def keyboard_up(key, x, y):
+    if key in held_keys and replay_player is None:
+        press(held_keys[key], False)
+
+def press(action, down):
+    if recorder is not None:
+        recorder.key(action, down)
+    sim.set_key(action, down)
+
+def start_game(difficulty):
+    global recorder
+    seed = random.randrange(2 ** 63) if game_seed is None else game_seed
+    if recording_path is not None:
+        recorder = replay.Recorder(recording_path, seed, difficulty)
+    sim.start_game(difficulty, seed)
+
+def stop_recording():
+    if recorder is not None:
+        recorder.close()
 
 def display():
+    global last_frame_time
+    now = time.perf_counter()
+    elapsed = 0.0 if last_frame_time is None else now - last_frame_time
+    last_frame_time = now
+
     GL.glClear(GL.GL_COLOR_BUFFER_BIT)
 
-    if difficulty is None:
+    if sim.game.difficulty is None:
+        sim.game.tick_accumulator = 0.0
         draw_difficulty_menu()
-    elif not game_over_lives and not game_over_blocks:
-        update_game_objects()
-        spawn_falling_hearts()
-        spawn_falling_arrows()
-        spawn_power_ups()
-        check_collisions()
-        check_game_over()
-        draw_game_objects()
-        update_score_and_lives()
+    elif not sim.game.game_over_lives and not sim.game.game_over_blocks:
+        if replay_player is None:
+            sim.advance_simulation(elapsed)
+        else:
+            advance_replay(elapsed)
+        with profiler.phase("draw"):
+            draw_game_objects()
+        with profiler.phase("hud"):
+            draw_hud()
     else:
+        sim.game.tick_accumulator = 0.0
+        if replay_player is not None:
+            advance_replay(0.0)  # Runs no ticks, but applies a restart recorded during the game over
         draw_game_over()
 
+    with profiler.phase("flush"):
+        flush_batches()
+    # The swap is left out, with VSync on it waits for the display rather than working
+    pace_frame(time.perf_counter() - now)
+    if profiler.enabled:
+        profiler.end_frame(time.perf_counter() - now, live_counts())
+        draw_profiler_overlay()
     GLUT.glutSwapBuffers()
 
+    # Input-to-photon latency: from the key press to this frame, the first to show its effect
+    if sim.game.input_applied_at is not None:
+        if profiler.enabled:
+            GL.glFinish()  # Wait until the swapped frame has actually been drawn
+            profiler.record_input_latency(time.perf_counter() - sim.game.input_applied_at)
+        sim.game.input_applied_at = None
+
+    if main_loop_started_at is not None and "first frame" not in startup_phases:
+        GL.glFinish()
+        startup_phases["first frame"] = time.perf_counter() - main_loop_started_at
+        if startup_report:
+            print_startup_report()
+
+def use_software_backend(width=sim.WINDOW_WIDTH, height=sim.WINDOW_HEIGHT):
+    # Route drawing into a NumPy framebuffer. It only takes batches, and display lists
+    # and the frozen HUD are GL objects, so those are switched off.
+    global backend, batch_rendering, layer_caching, adaptive_quality, quality
+    backend = software_render.Framebuffer(width, height)
+    batch_rendering = True
+    layer_caching = False
+    adaptive_quality = False
+    quality = 0
+    return backend
+
+def render_frame():
+    # Draw the current game state into the software framebuffer
+    backend.clear()
+    draw_game_objects()
+    draw_hud()
+    flush_batches()
+    return backend.pixels
+
+def render_replay(path, out_dir, frame_format="png", every=1):
+    # Render a recorded session offscreen, one image per rendered frame, as fast as it goes.
+    # A frame is rendered every `every` ticks; raw frames are bare RGB bytes.
+    use_software_backend()
+    player = replay.Player(path)
+    player.start()
+    os.makedirs(out_dir, exist_ok=True)
+    suffix = "png" if frame_format == "png" else f"{backend.width}x{backend.height}.rgb"
+    frames = 0
+    start = time.perf_counter()
+    while not player.finished:
+        player.advance(every)
+        pixels = render_frame()
+        name = os.path.join(out_dir, f"frame_{frames:06d}.{suffix}")
+        if frame_format == "png":
+            software_render.write_png(name, pixels)
+        else:
+            software_render.write_raw(name, pixels)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    game_seconds = sim.game.tick_count / sim.tick_rate
+    print(f"{frames} frames of {game_seconds:.1f} s of play in {elapsed:.1f} s "
+          f"({frames / elapsed:.0f} frames/s, {game_seconds / elapsed:.1f}x real time) to {out_dir}")
+
+# Golden images: every sprite at its in-game size, drawn through the software backend
+golden_sprites = {
+    "spaceship": sim.spaceship_width,
+    "heart": sim.heart_size,
+    "arrow": sim.arrow_size,
+    "arrow_simple": sim.arrow_size,
+    "power_up": sim.power_up_size,
+    "power_up_simple": sim.power_up_size,
+    "bullet": sim.bullet_length,
+    "hud_heart": 15,
+}
+golden_image_size = 96
+
+def render_sprite_image(shape, size):
+    # The sprite at the middle of a small frame, through the same path as in game
+    use_software_backend(golden_image_size, golden_image_size)
+    backend.clear()
+    draw_sprite(shape.replace("hud_", ""), golden_image_size // 2, golden_image_size // 2, size)
+    flush_batches()
+    return backend.pixels
+
+def check_golden_images(directory="golden", update=False):
+    # Compare every sprite pixel for pixel with its reference image, or rewrite the references.
+    # Only --update-golden writes references, a missing one fails the check.
+    if update:
+        os.makedirs(directory, exist_ok=True)
+    failures = 0
+    for shape, size in golden_sprites.items():
+        path = os.path.join(directory, f"{shape}.png")
+        pixels = render_sprite_image(shape, size)
+        if update:
+            software_render.write_png(path, pixels)
+            print(f"{shape:>16}: reference written")
+            continue
+        if not os.path.exists(path):
+            failures += 1
+            print(f"{shape:>16}: no reference {path}, run --update-golden to write it")
+            continue
+        image, different = software_render.diff_image(software_render.read_png(path), pixels)
+        if different:
+            failures += 1
+            software_render.write_png(os.path.join(directory, f"{shape}.diff.png"), image)
+            print(f"{shape:>16}: {different} pixels differ, see {shape}.diff.png")
+        else:
+            print(f"{shape:>16}: identical")
+    return failures == 0
+
+def load_gl():
+    global GL, GLUT
+    GL = importlib.import_module("OpenGL.GL")
+    GLUT = importlib.import_module("OpenGL.GLUT")
+
+def print_startup_report():
+    # Wall time of each startup phase; run python -X importtime or headless.py --import-times for imports
+    total = sum(startup_phases.values())
+    print(f"Startup: {total * 1000:.1f} ms to the first frame, "
+          f"not counting interpreter start-up before this module ran")
+    for phase, seconds in startup_phases.items():
+        print(f"  {phase:>12}: {seconds * 1000:8.1f} ms")
+
+def advance_replay(elapsed):
+    # Run the recorded ticks that replay_speed times the elapsed time covers
+    sim.game.tick_accumulator += elapsed * replay_speed
+    ticks = int(sim.game.tick_accumulator * sim.tick_rate)
+    sim.game.tick_accumulator -= ticks / sim.tick_rate
+    was_finished = replay_player.finished
+    replay_player.advance(ticks)
+    sim.game.render_alpha = 1.0
+    if replay_player.finished and not was_finished:
+        print(f"Replay finished after {sim.game.tick_count} ticks, score {sim.game.score}")
+
+def pace_frame(frame_seconds):
+    # Count budget overruns and step quality down under sustained load, back up with headroom
+    global frame_overruns, slow_frames, fast_frames
+    budget = 1.0 / target_fps
+    if frame_seconds > budget:
+        frame_overruns += 1
+    if not adaptive_quality:
+        return
+    if frame_seconds > 0.9 * budget:
+        slow_frames += 1
+        fast_frames = 0
+    elif frame_seconds < 0.5 * budget:
+        fast_frames += 1
+        slow_frames = 0
+    else:
+        slow_frames = fast_frames = 0
+
+    if slow_frames >= degrade_after and quality < len(QUALITY_LEVELS) - 1:
+        set_quality(quality + 1, f"frame {frame_seconds * 1000:.1f} ms over {budget * 900:.1f} ms for {slow_frames} frames")
+    elif fast_frames >= restore_after and quality > 0:
+        set_quality(quality - 1, f"frames under {budget * 500:.1f} ms for {fast_frames} frames")
+
+def set_quality(level, reason):
+    global quality, slow_frames, fast_frames
+    print(f"[{time.strftime('%H:%M:%S')}] quality {QUALITY_LEVELS[quality]} -> {QUALITY_LEVELS[level]}: {reason}")
+    quality = level
+    slow_frames = fast_frames = 0
+
+def toggle_adaptive_quality():
+    global adaptive_quality
+    adaptive_quality = not adaptive_quality
+    if not adaptive_quality and quality:
+        set_quality(0, "adaptive quality off")
+    print("Adaptive quality:", "on" if adaptive_quality else "off")
+
+def set_vsync(enabled):
+    # Set the swap interval through whichever platform extension this driver has; False if none
+    interval = 1 if enabled else 0
+    gl_error = importlib.import_module("OpenGL.error").Error
+    for module, name in (("OpenGL.WGL.EXT.swap_control", "wglSwapIntervalEXT"),
+                         ("OpenGL.GLX.MESA.swap_control", "glXSwapIntervalMESA"),
+                         ("OpenGL.GLX.EXT.swap_control", "glXSwapIntervalEXT")):
+        try:
+            function = getattr(importlib.import_module(module), name)
+            if not bool(function):
+                continue
+            if name == "glXSwapIntervalEXT":
+                GLX = importlib.import_module("OpenGL.GLX")
+                function(GLX.glXGetCurrentDisplay(), GLX.glXGetCurrentDrawable(), interval)
+            else:
+                function(interval)
+            return True
+        except (ImportError, AttributeError, OSError, gl_error):
+            continue
+    return False
+
+def live_counts():
+    entities = sim.game.entities
+    return {"quality": quality, "stars": len(sim.game.star_x), "bullets": entities.count(sim.BULLET),
+            "hearts": entities.count(sim.HEART), "arrows": entities.count(sim.ARROW),
+            "power_ups": entities.count(sim.POWER_UP), "blocks": len(sim.game.blocks), "lives": sim.game.lives}
+
+def draw_profiler_overlay():
+    GL.glColor3f(0.0, 1.0, 0.0)
+    pacing = (f"budget {1000 / target_fps:.1f} ms  overruns {frame_overruns}  "
+              f"quality {QUALITY_LEVELS[quality]}{'' if adaptive_quality else ' (fixed)'}")
+    for i, line in enumerate(profiler.summary_lines() + [pacing]):
+        draw_text(10, sim.WINDOW_HEIGHT - 50 - i * 15, line, GLUT.GLUT_BITMAP_HELVETICA_12, cached=False)
+
+def on_timer(value):
+    # Redraw at target_fps instead of spinning in an idle callback. Frames are scheduled
+    # against fixed deadlines, so the time spent drawing does not stretch the frame period.
+    global next_frame_time
+    budget = 1.0 / target_fps
+    now = time.perf_counter()
+    if next_frame_time is None or now - next_frame_time > budget:
+        next_frame_time = now  # More than a frame behind: start over instead of bursting to catch up
+    next_frame_time += budget
+    GLUT.glutTimerFunc(max(0, int((next_frame_time - now) * 1000)), on_timer, 0)
+    GLUT.glutPostRedisplay()
+
 def draw_difficulty_menu():
     GL.glColor3f(1.0, 1.0, 1.0)
 
@@ -525,47 +926,166 @@ def draw_difficulty_menu():
     ]
 
     for i, item in enumerate(menu_items):
-        GL.glRasterPos2f(WINDOW_WIDTH // 2 - 100, WINDOW_HEIGHT // 2 + 100 - i * 30)
-        for char in item:
-            GLUT.glutBitmapCharacter(GLUT.GLUT_BITMAP_TIMES_ROMAN_24, ord(char))
+        draw_text(sim.WINDOW_WIDTH // 2 - 100, sim.WINDOW_HEIGHT // 2 + 100 - i * 30, item)
 
 def draw_game_over():
-    if game_over_lives:
+    if sim.game.game_over_lives:
         GL.glColor3f(1.0, 0.0, 0.0)
-        GL.glRasterPos2f(WINDOW_WIDTH // 2 - 100, WINDOW_HEIGHT // 2)
-        for char in "Game Over":
-            GLUT.glutBitmapCharacter(GLUT.GLUT_BITMAP_TIMES_ROMAN_24, ord(char))
-    elif game_over_blocks:
+        draw_text(sim.WINDOW_WIDTH // 2 - 100, sim.WINDOW_HEIGHT // 2, "Game Over")
+    elif sim.game.game_over_blocks:
         GL.glColor3f(0.0, 1.0, 0.0)
-        GL.glRasterPos2f(WINDOW_WIDTH // 2 - 100, WINDOW_HEIGHT // 2)
-        for char in "You Win!":
-            GLUT.glutBitmapCharacter(GLUT.GLUT_BITMAP_TIMES_ROMAN_24, ord(char))
+        draw_text(sim.WINDOW_WIDTH // 2 - 100, sim.WINDOW_HEIGHT // 2, "You Win!")
             
     GL.glColor3f(1.0, 1.0, 1.0)
-    GL.glRasterPos2f(WINDOW_WIDTH // 2 - 100, WINDOW_HEIGHT // 2 - 30)
-    for char in f"Final Score: {score}":
-        GLUT.glutBitmapCharacter(GLUT.GLUT_BITMAP_HELVETICA_18, ord(char))
+    draw_text(sim.WINDOW_WIDTH // 2 - 100, sim.WINDOW_HEIGHT // 2 - 30, f"Final Score: {sim.game.score}", GLUT.GLUT_BITMAP_HELVETICA_18)
     
 
-    GL.glRasterPos2f(WINDOW_WIDTH // 2 - 100, WINDOW_HEIGHT // 2 - 60)
-    for char in "Press 'R' to restart":
-        GLUT.glutBitmapCharacter(GLUT.GLUT_BITMAP_HELVETICA_18, ord(char))
+    draw_text(sim.WINDOW_WIDTH // 2 - 100, sim.WINDOW_HEIGHT // 2 - 60, "Press 'R' to restart", GLUT.GLUT_BITMAP_HELVETICA_18)
+
+def benchmark_rendering(num_arrows=300, frames=200):
+    # Compare frame time of immediate mode, batched rendering and cached layers on a crowded scene
+    global batch_rendering, layer_caching
+    random.seed(0)
+    sim.game.difficulty = "Hard"
+    sim.init_game()
+    for _ in range(num_arrows):
+        sim.game.entities.spawn(sim.ARROW, random.randint(0, sim.WINDOW_WIDTH), random.randint(0, sim.WINDOW_HEIGHT))
+
+    modes = (("immediate", False, False), ("batched", True, False), ("batched + layers", True, True))
+    for name, batch_rendering, layer_caching in modes:
+        GL.glFinish()
+        start = time.perf_counter()
+        for _ in range(frames):
+            GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+            draw_game_objects()
+            update_score_and_lives()
+            flush_batches()
+            GLUT.glutSwapBuffers()
+        GL.glFinish()
+        frame_ms = (time.perf_counter() - start) * 1000 / frames
+        print(f"{name:>16}: {frame_ms:.2f} ms/frame ({num_arrows} arrows)")
+    print("Sprite cache:", sprite_cache_stats())
+
+def benchmark_fill(counts=(20, 200, 2000), frames=20):
+    # Compare point-plotted and quad-filled blocks and check they cover the same pixels
+    global batch_rendering
+    batch_rendering = True
+    random.seed(0)
+    set_color(0.8, 0.3, 0.1)
+    for count in counts:
+        rects = []
+        for _ in range(count):
+            size = random.choice(sim.block_sizes)
+            rects.append((random.randint(0, sim.WINDOW_WIDTH - size), random.randint(0, sim.WINDOW_HEIGHT - size), size + 1))
+
+        results = []
+        for fill in (fill_rect_points, fill_rect):
+            GL.glFinish()
+            start = time.perf_counter()
+            for _ in range(frames):
+                GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+                for x, y, size in rects:
+                    fill(x, y, size, size)
+                flush_batches()
+            GL.glFinish()
+            frame_ms = (time.perf_counter() - start) * 1000 / frames
+            pixels = GL.glReadPixels(0, 0, sim.WINDOW_WIDTH, sim.WINDOW_HEIGHT, GL.GL_RGB, GL.GL_UNSIGNED_BYTE)
+            results.append((frame_ms, pixels))
+            GLUT.glutSwapBuffers()
+
+        (points_ms, points_pixels), (quads_ms, quads_pixels) = results
+        print(f"{count:>5} blocks: points {points_ms:.2f} ms, quads {quads_ms:.2f} ms, "
+              f"same coverage: {points_pixels == quads_pixels}")
 
 def main():
+    global target_fps, vsync, adaptive_quality, game_seed, recording_path, replay_player, replay_speed
+    global startup_report, main_loop_started_at
+    startup_phases["imports"] = time.perf_counter() - startup_start
+    # python Project-2.py --startup-report
+    startup_report = "--startup-report" in sys.argv
+
+    # python Project-2.py --tick-rate 60 --fps 60
+    if "--tick-rate" in sys.argv:
+        sim.set_tick_rate(int(sys.argv[sys.argv.index("--tick-rate") + 1]))
+    if "--fps" in sys.argv:
+        target_fps = int(sys.argv[sys.argv.index("--fps") + 1])
+    # python Project-2.py --vsync on|off [--fixed-quality]
+    if "--vsync" in sys.argv:
+        vsync = sys.argv[sys.argv.index("--vsync") + 1] == "on"
+    adaptive_quality = "--fixed-quality" not in sys.argv
+
+    # python Project-2.py --record session.rec [--seed 1234]
+    # python Project-2.py --replay session.rec [--replay-speed 4]  (python headless.py --replay without rendering)
+    if "--seed" in sys.argv:
+        game_seed = int(sys.argv[sys.argv.index("--seed") + 1])
+    # python Project-2.py --endless: block waves keep scrolling in, the game only ends with the last life
+    sim.game.endless = "--endless" in sys.argv
+    if "--record" in sys.argv:
+        recording_path = sys.argv[sys.argv.index("--record") + 1]
+        atexit.register(stop_recording)
+    if "--replay-speed" in sys.argv:
+        replay_speed = float(sys.argv[sys.argv.index("--replay-speed") + 1])
+    if "--replay" in sys.argv:
+        replay_player = replay.Player(sys.argv[sys.argv.index("--replay") + 1])
+        replay_player.start()
+
+    # python Project-2.py --profile-log frames.csv (or .jsonl)
+    if "--profile-log" in sys.argv:
+        profiler.open_log(sys.argv[sys.argv.index("--profile-log") + 1])
+
+    # Software rendering, no GL or display needed:
+    # python Project-2.py --render-replay session.rec frames/ [--frame-format png|raw] [--frame-every 1]
+    # python Project-2.py --check-golden [dir] / --update-golden [dir]
+    if "--render-replay" in sys.argv:
+        path, out_dir = sys.argv[sys.argv.index("--render-replay") + 1:][:2]
+        frame_format = sys.argv[sys.argv.index("--frame-format") + 1] if "--frame-format" in sys.argv else "png"
+        every = int(sys.argv[sys.argv.index("--frame-every") + 1]) if "--frame-every" in sys.argv else 1
+        render_replay(path, out_dir, frame_format, every)
+        return
+    for flag in ("--check-golden", "--update-golden"):
+        if flag in sys.argv:
+            args = sys.argv[sys.argv.index(flag) + 1:]
+            directory = args[0] if args and not args[0].startswith("--") else "golden"
+            sys.exit(0 if check_golden_images(directory, update=flag == "--update-golden") else 1)
+
+    start = time.perf_counter()
+    load_gl()
+    startup_phases["GL import"] = time.perf_counter() - start
+
+    start = time.perf_counter()
     GLUT.glutInit()
     GLUT.glutInitDisplayMode(GLUT.GLUT_DOUBLE | GLUT.GLUT_RGB)
-    GLUT.glutInitWindowSize(WINDOW_WIDTH, WINDOW_HEIGHT)
+    GLUT.glutInitWindowSize(sim.WINDOW_WIDTH, sim.WINDOW_HEIGHT)
     GLUT.glutCreateWindow(b"Space Shoot Game")
     GL.glClearColor(0.0, 0.0, 0.0, 0.0)
     GL.glMatrixMode(GL.GL_PROJECTION)
     GL.glLoadIdentity()
-    GL.glOrtho(0.0, WINDOW_WIDTH, 0.0, WINDOW_HEIGHT, -1.0, 1.0)
+    GL.glOrtho(0.0, sim.WINDOW_WIDTH, 0.0, sim.WINDOW_HEIGHT, -1.0, 1.0)
+    if vsync is not None:
+        applied = set_vsync(vsync)
+        print("VSync:", ("on" if vsync else "off") if applied else "not supported by this driver")
+    startup_phases["window"] = time.perf_counter() - start
+
+    # python Project-2.py --bench-render [num_arrows]
+    if "--bench-render" in sys.argv:
+        args = sys.argv[sys.argv.index("--bench-render") + 1:]
+        benchmark_rendering(int(args[0]) if args else 300)
+        return
+
+    # python Project-2.py --bench-fill
+    if "--bench-fill" in sys.argv:
+        benchmark_fill()
+        return
 
     GLUT.glutDisplayFunc(display)
     GLUT.glutKeyboardFunc(keyboard)
-    GLUT.glutIdleFunc(display)
+    GLUT.glutKeyboardUpFunc(keyboard_up)
+    GLUT.glutIgnoreKeyRepeat(1)  # Held keys are tracked as state, repeats would only queue events
+    if bool(GLUT.glutCloseFunc):
+        GLUT.glutCloseFunc(stop_recording)  # freeglut exits without running atexit handlers
+    GLUT.glutTimerFunc(0, on_timer, 0)
+    main_loop_started_at = time.perf_counter()
     GLUT.glutMainLoop()
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,221 @@
+# Batch simulation for tuning difficulty_settings: plays many headless games per
+# point of a parameter grid across a process pool and aggregates the outcomes.
+# Imports no OpenGL.
+#
+#   python batch.py --difficulty Hard --grid arrow_speed=5,7,9 arrow_spawn_rate=0.05,0.1
+#                   --games 1000 --policy dodge --workers 8 --out results.csv [--games-out games.csv]
+#
+# Results stream back from the workers in chunks and are folded into per-point
+# counters and histograms as they arrive, so memory does not grow with the number
+# of games. --games-out appends one row per game as it finishes.
+import csv
+import itertools
+import os
+import random
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import numpy as np
+
+import simulation as sim
+from headless import option
+
+default_settings = {name: dict(settings) for name, settings in sim.difficulty_settings.items()}
+
+# Policies: make_<policy>(rng) returns a function called before every tick that sets
+# the held keys, the same way keyboard input does in the game
+
+def make_scripted(rng):
+    # Drift left and right in random bursts and keep firing
+    state = {"direction": 0, "hold": 0}
+
+    def act():
+        if state["hold"] == 0:
+            state["direction"] = rng.choice((-1, 0, 1))
+            state["hold"] = rng.randint(5, 30)
+        state["hold"] -= 1
+        steer(state["direction"], True)
+    return act
+
+def make_random(rng):
+    # Change direction and fire button at random moments
+    state = {"direction": 0, "fire": False}
+
+    def act():
+        if rng.random() < 0.05:
+            state["direction"] = rng.choice((-1, 0, 1))
+        if rng.random() < 0.05:
+            state["fire"] = not state["fire"]
+        steer(state["direction"], state["fire"])
+    return act
+
+def make_dodge(rng):
+    # Step away from arrows about to land on the ship, otherwise chase hearts and
+    # the remaining blocks, firing all the time
+    lookahead = 150
+
+    def act():
+        entities = sim.game.entities
+        center = sim.game.spaceship_x + sim.spaceship_width / 2
+        x = entities.x[:entities.used]
+        y = entities.y[:entities.used]
+        danger = entities.select(sim.ARROW, entities.mask)
+        danger &= (y > sim.spaceship_y) & (y < sim.spaceship_y + lookahead) & (np.abs(x - center) < sim.spaceship_width)
+        if danger.any():
+            steer(1 if x[danger].mean() < center else -1, True)
+            return
+        hearts = entities.select(sim.HEART, entities.mask)
+        if hearts.any():
+            target = x[hearts][np.argmin(y[hearts])]
+        elif sim.game.blocks:
+            target = sim.game.blocks[0]['x'] + sim.game.blocks[0]['size'] / 2
+        else:
+            target = center
+        steer(0 if abs(target - center) < sim.spaceship_hold_speed else (1 if target > center else -1), True)
+    return act
+
+POLICIES = {"scripted": make_scripted, "random": make_random, "dodge": make_dodge}
+
+def steer(direction, fire):
+    if sim.game.held_left != (direction < 0):
+        sim.set_key("left", direction < 0)
+    if sim.game.held_right != (direction > 0):
+        sim.set_key("right", direction > 0)
+    if sim.game.held_fire != fire:
+        sim.set_key("fire", fire)
+
+def play_game(difficulty, settings, policy, seed, max_ticks):
+    # One game from a seed; returns (outcome, ticks survived, score)
+    sim.difficulty_settings[difficulty] = dict(default_settings[difficulty], **settings)
+    sim.start_game(difficulty, seed)
+    act = POLICIES[policy](random.Random(seed))
+    while sim.game.tick_count < max_ticks:
+        act()
+        sim.step_game()
+        if sim.game.game_over_lives:
+            return "loss", sim.game.tick_count, sim.game.score
+        if sim.game.game_over_blocks:
+            return "win", sim.game.tick_count, sim.game.score
+    return "timeout", sim.game.tick_count, sim.game.score
+
+def play_chunk(task):
+    # Worker entry point: a run of seeds at one grid point
+    point, difficulty, settings, policy, seeds, max_ticks = task
+    return point, [(seed,) + play_game(difficulty, settings, policy, seed, max_ticks) for seed in seeds]
+
+def parse_grid(args):
+    # ["arrow_speed=5,7", "arrow_spawn_rate=0.05,0.1"] -> list of settings dicts, one per combination
+    axes = []
+    for arg in args:
+        name, values = arg.split("=")
+        if name not in default_settings["Hard"]:
+            raise SystemExit(f"unknown setting {name!r}, expected one of {', '.join(default_settings['Hard'])}")
+        axes.append([(name, float(value)) for value in values.split(",")])
+    return [dict(combination) for combination in itertools.product(*axes)]
+
+def histogram_percentile(histogram, total, fraction):
+    # Percentile of the values counted in a Counter
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen > fraction * total:
+            return value
+    return 0
+
+class Aggregate:
+    # Running totals for one grid point; memory depends on the score and survival ranges, not the game count
+    def __init__(self):
+        self.outcomes = Counter()
+        self.survival_sum = 0
+        self.survival = Counter()  # Whole seconds survived -> games
+        self.scores = Counter()  # Score -> games
+
+    def add(self, outcome, ticks, score):
+        self.outcomes[outcome] += 1
+        self.survival_sum += ticks
+        self.survival[ticks // sim.tick_rate] += 1
+        self.scores[score] += 1
+
+    def row(self):
+        games = sum(self.outcomes.values())
+        return {
+            "games": games,
+            "win_rate": round(self.outcomes["win"] / games, 4),
+            "loss_rate": round(self.outcomes["loss"] / games, 4),
+            "timeout_rate": round(self.outcomes["timeout"] / games, 4),
+            "survival_mean_s": round(self.survival_sum / games / sim.tick_rate, 2),
+            "survival_p50_s": histogram_percentile(self.survival, games, 0.5),
+            "survival_p90_s": histogram_percentile(self.survival, games, 0.9),
+            "score_mean": round(sum(score * count for score, count in self.scores.items()) / games, 2),
+            "score_p10": histogram_percentile(self.scores, games, 0.1),
+            "score_p50": histogram_percentile(self.scores, games, 0.5),
+            "score_p90": histogram_percentile(self.scores, games, 0.9),
+            "score_max": max(self.scores),
+        }
+
+def run_batch(difficulty, grid, games, policy="dodge", workers=None, seed=0, max_ticks=None,
+              chunk_size=50, games_out=None):
+    # Play games seeds per grid point on a process pool; returns one result row per point.
+    # Every point uses the same seeds, so differences between points come from the settings.
+    workers = workers or os.cpu_count()
+    max_ticks = max_ticks or 10 * 60 * sim.tick_rate
+    tasks = ((point, difficulty, settings, policy, range(start, min(start + chunk_size, seed + games)), max_ticks)
+             for point, settings in enumerate(grid)
+             for start in range(seed, seed + games, chunk_size))
+    aggregates = [Aggregate() for _ in grid]
+
+    game_writer = None
+    if games_out:
+        games_file = open(games_out, "w", newline="", buffering=1)
+        game_writer = csv.writer(games_file)
+        game_writer.writerow(list(grid[0]) + ["seed", "outcome", "ticks", "score"])
+    start = time.perf_counter()
+    try:
+        with Pool(workers) as pool:
+            for point, results in pool.imap_unordered(play_chunk, tasks):
+                for game_seed, outcome, ticks, score in results:
+                    aggregates[point].add(outcome, ticks, score)
+                    if game_writer:
+                        game_writer.writerow(list(grid[point].values()) + [game_seed, outcome, ticks, score])
+    finally:
+        if game_writer:
+            games_file.close()
+    elapsed = time.perf_counter() - start
+
+    total = games * len(grid)
+    print(f"{total} games on {workers} workers in {elapsed:.1f} s ({total / elapsed:.0f} games/s)", file=sys.stderr)
+    return [dict(settings, **aggregate.row()) for settings, aggregate in zip(grid, aggregates)]
+
+def write_table(rows, path=None):
+    # CSV to a file, or an aligned table on stdout
+    if path:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return
+    columns = list(rows[0])
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[column]).rjust(width) for column, width in zip(columns, widths)))
+
+def grid_args():
+    if "--grid" not in sys.argv:
+        return []
+    args = sys.argv[sys.argv.index("--grid") + 1:]
+    return list(itertools.takewhile(lambda arg: not arg.startswith("--"), args))
+
+def main():
+    difficulty = option("--difficulty", "Hard")
+    grid = parse_grid(grid_args())
+    max_ticks = option("--max-ticks", 0)
+    rows = run_batch(difficulty, grid, option("--games", 100), option("--policy", "dodge"),
+                     option("--workers", 0), option("--seed", 0), max_ticks,
+                     games_out=option("--games-out", ""))
+    write_table(rows, option("--out", ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,709 @@
+# Headless simulation runner and benchmarks. Imports no OpenGL, so it runs on
+# machines without a display.
+#
+#   python headless.py --difficulty Hard --ticks 10000 --seed 1 [--inputs inputs.txt] [--endless]
+#   python headless.py --bench
+#   python headless.py --bench-collisions
+#   python headless.py --bench-swept [--speed 2]
+#   python headless.py --bench-entities
+#   python headless.py --bench-spawns
+#   python headless.py --check-allocations
+#   python headless.py --check-replay
+#   python headless.py --check-sessions
+#   python headless.py --bench-layout
+#   python headless.py --soak [seconds]
+#   python headless.py --import-times
+#   python headless.py --replay session.rec
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import replay
+import simulation as sim
+
+# Benchmark presets: a difficulty plus optional overrides for its settings.
+# Stress presets rain extra arrows every tick (about 100 ticks on screen each)
+# and give the ship enough lives to survive them.
+PRESETS = {
+    "Easy": {"difficulty": "Easy"},
+    "Medium": {"difficulty": "Medium"},
+    "Hard": {"difficulty": "Hard"},
+    "Stress-10k": {"difficulty": "Hard", "arrows_per_tick": 100, "lives": 10 ** 9,
+                   "settings": {"heart_spawn_rate": 0.05}},
+    "Stress-50k": {"difficulty": "Hard", "arrows_per_tick": 500, "lives": 10 ** 9,
+                   "settings": {"heart_spawn_rate": 0.05}},
+}
+
+# Scripted input is a list of (tick, action, down) key events, applied with sim.set_key before
+# the tick they are stamped with, so the ship moves and fires through apply_input like the game
+
+def scripted_inputs(ticks, seed=0):
+    # Deterministic input stream: drift left and right in random bursts, keep fire held down
+    rand = random.Random(seed)
+    events = [(0, "fire", True)]
+    direction = 0
+    hold = 0
+    for tick in range(ticks):
+        if hold == 0:
+            new_direction = rand.choice((-1, 0, 1))
+            hold = rand.randint(5, 30)
+            if new_direction != direction:
+                if direction:
+                    events.append((tick, "left" if direction < 0 else "right", False))
+                if new_direction:
+                    events.append((tick, "left" if new_direction < 0 else "right", True))
+                direction = new_direction
+        hold -= 1
+    return events
+
+def load_inputs(path):
+    # One "tick action down|up" key event per line, e.g. "120 fire down"; actions are left, right and fire
+    events = []
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                tick, action, state = line.split()
+                if action not in replay.KEYS or state not in ("down", "up"):
+                    raise ValueError(f"bad input line: {line.strip()!r}")
+                events.append((int(tick), action, state == "down"))
+    events.sort(key=lambda event: event[0])
+    return events
+
+def apply_inputs(inputs, next_event, tick):
+    # Press and release the keys stamped up to this tick; returns the index of the next event
+    while next_event < len(inputs) and inputs[next_event][0] <= tick:
+        _, action, down = inputs[next_event]
+        sim.set_key(action, down)
+        next_event += 1
+    return next_event
+
+def run_headless(ticks, difficulty="Hard", seed=0, inputs=None, preset=None):
+    # Step the simulation for a number of ticks and time each phase
+    preset = preset or {"difficulty": difficulty}
+    difficulty = preset["difficulty"]
+    saved_settings = dict(sim.difficulty_settings[difficulty])
+    sim.difficulty_settings[difficulty].update(preset.get("settings", {}))
+    arrows_per_tick = preset.get("arrows_per_tick", 0)
+    arrow_speed = sim.difficulty_settings[difficulty]["arrow_speed"] * sim.tick_scale
+    if inputs is None:
+        inputs = scripted_inputs(ticks, seed)
+
+    try:
+        sim.seed_rng(seed)
+        sim.game.difficulty = difficulty
+        sim.release_keys()
+        sim.restart_game()
+        sim.game.lives = preset.get("lives", sim.game.lives)
+
+        timings = {"update": 0.0, "spawn": 0.0, "collide": 0.0}
+        wins = losses = 0
+        next_event = 0
+        clock = time.perf_counter
+        start = clock()
+        for tick in range(ticks):
+            next_event = apply_inputs(inputs, next_event, tick)
+
+            t0 = clock()
+            sim.apply_input()
+            sim.update_game_objects()
+            t1 = clock()
+            sim.spawn_objects()
+            if arrows_per_tick:
+                xs = [random.randint(0, sim.WINDOW_WIDTH) for _ in range(arrows_per_tick)]
+                sim.game.entities.spawn_many(sim.ARROW, xs, sim.WINDOW_HEIGHT, 0, -arrow_speed)
+            t2 = clock()
+            sim.check_collisions()
+            sim.check_game_over()
+            t3 = clock()
+            timings["update"] += t1 - t0
+            timings["spawn"] += t2 - t1
+            timings["collide"] += t3 - t2
+
+            # Keep going with a fresh game so every run covers the requested ticks
+            if sim.game.game_over_lives or sim.game.game_over_blocks:
+                if sim.game.game_over_lives:
+                    losses += 1
+                else:
+                    wins += 1
+                sim.restart_game()
+                sim.game.lives = preset.get("lives", sim.game.lives)
+        elapsed = clock() - start
+    finally:
+        sim.difficulty_settings[difficulty].update(saved_settings)
+
+    return {
+        "difficulty": difficulty,
+        "seed": seed,
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_second": ticks / elapsed if elapsed else float("inf"),
+        "phase_seconds": timings,
+        "wins": wins,
+        "losses": losses,
+        "score": sim.game.score,
+        "lives": sim.game.lives,
+        "blocks": len(sim.game.blocks),
+        "entities": {name: sim.game.entities.count(kind) for name, kind in
+                     (("bullets", sim.BULLET), ("hearts", sim.HEART),
+                      ("arrows", sim.ARROW), ("power_ups", sim.POWER_UP))},
+    }
+
+def print_report(report):
+    print(f"{report['difficulty']} seed {report['seed']}: {report['ticks']} ticks in {report['seconds']:.3f} s "
+          f"({report['ticks_per_second']:.0f} ticks/s)")
+    for phase, seconds in report["phase_seconds"].items():
+        print(f"  {phase:>8}: {seconds * 1e6 / report['ticks']:.1f} us/tick")
+    print(f"  games won {report['wins']}, lost {report['losses']}; "
+          f"current game score {report['score']}, lives {report['lives']}, blocks {report['blocks']}")
+    print("  entities:", ", ".join(f"{name} {count}" for name, count in report["entities"].items()))
+
+def run_replay(path):
+    # Rerun a recorded session (python Project-2.py --record) as fast as possible, timing each phase
+    player = replay.Player(path)
+    player.start()
+    timings = {"update": 0.0, "spawn": 0.0, "collide": 0.0}
+    wins = losses = 0
+    clock = time.perf_counter
+    start = clock()
+    while player.apply_events():
+        t0 = clock()
+        sim.apply_input()
+        sim.update_game_objects()
+        t1 = clock()
+        sim.spawn_objects()
+        t2 = clock()
+        sim.check_collisions()
+        sim.check_game_over()
+        t3 = clock()
+        timings["update"] += t1 - t0
+        timings["spawn"] += t2 - t1
+        timings["collide"] += t3 - t2
+        if sim.game.game_over_lives:
+            losses += 1
+        elif sim.game.game_over_blocks:
+            wins += 1
+    elapsed = clock() - start
+
+    ticks = sim.game.tick_count
+    return {
+        "difficulty": player.difficulty,
+        "seed": player.seed,
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_second": ticks / elapsed if elapsed else float("inf"),
+        "phase_seconds": timings,
+        "wins": wins,
+        "losses": losses,
+        "score": sim.game.score,
+        "lives": sim.game.lives,
+        "blocks": len(sim.game.blocks),
+        "entities": {name: sim.game.entities.count(kind) for name, kind in
+                     (("bullets", sim.BULLET), ("hearts", sim.HEART),
+                      ("arrows", sim.ARROW), ("power_ups", sim.POWER_UP))},
+    }
+
+def run_benchmarks(ticks=2000, seed=0):
+    print(f"{'preset':>10} {'ticks/s':>9} {'update':>9} {'spawn':>9} {'collide':>9} {'entities':>9}")
+    for name, preset in PRESETS.items():
+        report = run_headless(ticks, seed=seed, preset=preset)
+        per_tick = {phase: seconds * 1e6 / ticks for phase, seconds in report["phase_seconds"].items()}
+        print(f"{name:>10} {report['ticks_per_second']:>9.0f} {per_tick['update']:>7.1f}us "
+              f"{per_tick['spawn']:>7.1f}us {per_tick['collide']:>7.1f}us {sum(report['entities'].values()):>9}")
+
+def brute_force_bullet_hits(bullets, blocks):
+    # Reference all-pairs bullet-block check, as check_collisions used to do it
+    hits = []
+    for bullet in bullets[:]:
+        for block in blocks[:]:
+            if (block['x'] < bullet['x'] < block['x'] + block['size'] and
+                block['y'] < bullet['y'] < block['y'] + block['size']):
+                bullets.remove(bullet)
+                blocks.remove(block)
+                hits.append((bullet['x'], bullet['y'], block['x'], block['y']))
+                break
+    return hits
+
+def benchmark_collisions(seeds=200, num_bullets=300):
+    # Check the grid gives the same hits as the brute-force scan on seeded scenes
+    sim.game.difficulty = "Hard"
+    grid_time = brute_force_time = 0.0
+    mismatches = 0
+    for seed in range(seeds):
+        random.seed(seed)
+        sim.init_game()
+        for _ in range(num_bullets):
+            sim.game.entities.spawn(sim.BULLET, random.uniform(0, sim.WINDOW_WIDTH), random.uniform(sim.WINDOW_HEIGHT // 2, sim.WINDOW_HEIGHT))
+        bullet_indices = sim.game.entities.indices(sim.BULLET)
+        reference_bullets = [{'x': x, 'y': y} for x, y in zip(sim.game.entities.x[bullet_indices].tolist(), sim.game.entities.y[bullet_indices].tolist())]
+        reference_blocks = [dict(b) for b in sim.game.blocks]
+
+        start = time.perf_counter()
+        expected = brute_force_bullet_hits(reference_bullets, reference_blocks)
+        brute_force_time += time.perf_counter() - start
+
+        sim.game.score = 0
+        start = time.perf_counter()
+        sim.check_collisions()
+        grid_time += time.perf_counter() - start
+
+        bullet_indices = sim.game.entities.indices(sim.BULLET)
+        same_bullets = (list(zip(sim.game.entities.x[bullet_indices].tolist(), sim.game.entities.y[bullet_indices].tolist())) ==
+                        [(b['x'], b['y']) for b in reference_bullets])
+        same_blocks = sorted((b['x'], b['y']) for b in sim.game.blocks) == sorted((b['x'], b['y']) for b in reference_blocks)
+        if sim.game.score != len(expected) or not same_bullets or not same_blocks:
+            mismatches += 1
+
+    print(f"{seeds} scenes, {num_bullets} bullets: brute force {brute_force_time * 1000 / seeds:.3f} ms, "
+          f"grid {grid_time * 1000 / seeds:.3f} ms, mismatches: {mismatches}")
+    return mismatches == 0
+
+def swept_scene(rate, seconds, seed=0, speed=1):
+    # A scripted endless-mode scene played at one tick rate: the ship sweeps left and right
+    # at 360 px/s, fires three-way volleys every 0.2 s into 30 arrows a second, and has its
+    # shield up through the middle third. Everything happens on a 1/15 s beat and moves at a
+    # constant velocity, so objects are in the same places at every beat whatever the rate
+    # and only the collision tests can make the outcome differ. Returns hit counts and time.
+    beat = rate // 15
+    ticks = seconds * rate
+    saved = sim.bullet_speed, sim.game.endless
+    sim.set_tick_rate(rate)
+    sim.bullet_speed = saved[0] * speed
+    sim.game.endless = True
+    arrow_speed = sim.difficulty_settings["Hard"]["arrow_speed"] * speed * sim.tick_scale
+    arrow_rand = random.Random(seed)
+    try:
+        sim.start_game("Hard", seed)
+        sim.game.lives = 10 ** 9
+        shield_hits = 0
+        collide_time = 0.0
+        clock = time.perf_counter
+        for tick in range(1, ticks + 1):
+            distance = 360 * tick // rate % 1440  # Back and forth over 720 px
+            sim.game.spaceship_x = 90 + (distance if distance < 720 else 1440 - distance)
+            sim.update_game_objects()
+            arrows = sim.game.entities.count(sim.ARROW) if sim.game.invincible else 0
+            start = clock()
+            sim.check_collisions()
+            collide_time += clock() - start
+            if sim.game.invincible:
+                shield_hits += arrows - sim.game.entities.count(sim.ARROW)
+            if tick % beat == 0:
+                sim.game.invincible = ticks // 3 <= tick < 2 * ticks // 3
+                sim.game.entities.spawn(sim.ARROW, arrow_rand.uniform(0, sim.WINDOW_WIDTH), sim.WINDOW_HEIGHT, 0, -arrow_speed)
+                sim.game.entities.spawn(sim.ARROW, arrow_rand.uniform(0, sim.WINDOW_WIDTH), sim.WINDOW_HEIGHT, 0, -arrow_speed)
+                if tick % (3 * beat) == 0:
+                    sim.game.three_way_shoot = True
+                    sim.shoot_bullet()
+        return {"blocks": sim.game.score, "ship": 10 ** 9 - sim.game.lives, "shield": shield_hits, "collide_time": collide_time}
+    finally:
+        sim.set_tick_rate(sim.BASE_TICK_RATE)
+        sim.bullet_speed, sim.game.endless = saved
+
+def benchmark_swept(rates=(60, 30, 15), seconds=60, seed=0, speed=1):
+    # Hits in the same scene at coarser and coarser ticks, with swept tests and with the
+    # old end-of-tick point tests. Swept tests should count the same hits at every rate.
+    saved = sim.swept_collisions
+    print(f"speed x{speed}, {seconds} s of game time")
+    print(f"{'tests':>6} {'ticks/s':>8} {'blocks':>7} {'ship':>6} {'shield':>7} {'collide ms/s':>13}")
+    same = True
+    try:
+        for swept in (True, False):
+            sim.swept_collisions = swept
+            counts = []
+            for rate in rates:
+                result = swept_scene(rate, seconds, seed, speed)
+                counts.append((result["blocks"], result["ship"], result["shield"]))
+                print(f"{'swept' if swept else 'point':>6} {rate:>8} {result['blocks']:>7} {result['ship']:>6} "
+                      f"{result['shield']:>7} {result['collide_time'] * 1000 / seconds:>13.2f}")
+            if swept:
+                same = len(set(counts)) == 1
+    finally:
+        sim.swept_collisions = saved
+    print("swept hits equal at every rate:", same)
+    return same
+
+def polled_spawns():
+    # Reference spawn_objects as it used to be: one draw per spawner every tick
+    settings = sim.difficulty_settings[sim.game.difficulty]
+    if random.random() < sim.tick_chance(settings["heart_spawn_rate"]):
+        sim.spawn_falling_hearts()
+    if random.random() < sim.tick_chance(settings["arrow_spawn_rate"]):
+        sim.spawn_falling_arrows()
+    if random.random() < sim.tick_chance(sim.power_up_spawn_rate):
+        sim.spawn_power_ups()
+
+def benchmark_spawns(ticks=2_000_000, seed=0):
+    # Spawn counts and cost per tick from the scheduler against the per-tick draws it
+    # replaced; both counts should agree with the expected ticks * chance
+    settings = sim.difficulty_settings["Hard"]
+    chances = ((sim.HEART, "hearts", sim.tick_chance(settings["heart_spawn_rate"])),
+               (sim.ARROW, "arrows", sim.tick_chance(settings["arrow_spawn_rate"])),
+               (sim.POWER_UP, "power_ups", sim.tick_chance(sim.power_up_spawn_rate)))
+    results = []
+    for spawn in (polled_spawns, sim.spawn_objects):
+        sim.seed_rng(seed)
+        sim.game.difficulty = "Hard"
+        sim.restart_game()
+        counts = dict.fromkeys([kind for kind, _, _ in chances], 0)
+        elapsed = 0.0
+        # Spawns stay where they appear; count and clear them every 1000 ticks, outside the timed region
+        for _ in range(ticks // 1000):
+            start = time.perf_counter()
+            for _ in range(1000):
+                sim.game.tick_count += 1
+                spawn()
+            elapsed += time.perf_counter() - start
+            for kind in counts:
+                counts[kind] += sim.game.entities.count(kind)
+            sim.game.entities.clear()
+        results.append((counts, elapsed))
+
+    (polled, polled_time), (scheduled, scheduled_time) = results
+    print(f"{ticks} ticks: per-tick draws {polled_time * 1e6 / ticks:.2f} us/tick, "
+          f"scheduled {scheduled_time * 1e6 / ticks:.2f} us/tick")
+    print(f"{'kind':>9} {'expected':>9} {'per-tick':>9} {'scheduled':>10} {'z':>6}")
+    consistent = True
+    for kind, name, chance in chances:
+        expected = ticks * chance
+        z = (scheduled[kind] - expected) / math.sqrt(expected * (1 - chance))
+        consistent = consistent and abs(z) < 4
+        print(f"{name:>9} {expected:>9.0f} {polled[kind]:>9} {scheduled[kind]:>10} {z:>6.2f}")
+    print("spawn counts consistent:", consistent)
+    return consistent
+
+def benchmark_entities(counts=(100, 1000, 10000, 50000), frames=200):
+    # Per-frame update_game_objects cost as the number of live entities grows
+    sim.game.difficulty = "Hard"
+    random.seed(0)
+    kinds = (sim.BULLET, sim.HEART, sim.ARROW, sim.POWER_UP)
+    for count in counts:
+        sim.game.entities.clear()
+        while sim.game.entities.count() < count:
+            kind = kinds[sim.game.entities.count() % len(kinds)]
+            sim.game.entities.spawn(kind, random.uniform(0, sim.WINDOW_WIDTH), random.uniform(0, sim.WINDOW_HEIGHT), 0, -2 if kind != sim.BULLET else 2)
+
+        elapsed = 0.0
+        for _ in range(frames):
+            start = time.perf_counter()
+            sim.update_game_objects()
+            elapsed += time.perf_counter() - start
+            # Refill culled entities outside the timed region to keep the count steady
+            while sim.game.entities.count() < count:
+                sim.game.entities.spawn(sim.ARROW, random.uniform(0, sim.WINDOW_WIDTH), sim.WINDOW_HEIGHT, 0, -2)
+        print(f"{count:>6} entities: {elapsed * 1e6 / frames:.1f} us/frame")
+
+def rejection_layout(count, gap, area):
+    # Reference layout as init_game used to do it: unbounded rejection sampling with an all-pairs scan
+    left, bottom, right, top = area
+    blocks = []
+    for _ in range(count):
+        block_size = random.choice(sim.block_sizes)
+        while True:
+            block_x = random.randint(left, right - block_size)
+            block_y = random.randint(bottom, top - block_size)
+            if not any(abs(block['x'] - block_x) < block_size + gap and abs(block['y'] - block_y) < block_size + gap
+                       for block in blocks):
+                blocks.append({'x': block_x, 'y': block_y, 'size': block_size})
+                break
+    return blocks
+
+def benchmark_layout(counts=(20, 500, 5000), reference_limit=500):
+    # Layout time at the default density (the area grows with the block count), then how
+    # quickly an impossible layout is reported. The unbounded reference is skipped past reference_limit.
+    gap = sim.block_gap
+    default_area = (0, sim.WINDOW_HEIGHT // 2, sim.WINDOW_WIDTH, sim.WINDOW_HEIGHT)
+    default_height = default_area[3] - default_area[1]
+    for count in counts:
+        area = (0, 0, sim.WINDOW_WIDTH, default_height * count // sim.block_count)
+        runs = max(1, 2000 // count)
+        random.seed(0)
+        start = time.perf_counter()
+        for _ in range(runs):
+            blocks = sim.layout_blocks(count, gap, area)
+        layout_time = (time.perf_counter() - start) / runs
+        line = f"{count:>5} blocks: layout {layout_time * 1000:.2f} ms"
+        if count <= reference_limit:
+            random.seed(0)
+            start = time.perf_counter()
+            for _ in range(runs):
+                rejection_layout(count, gap, area)
+            line += f", rejection sampling {(time.perf_counter() - start) / runs * 1000:.2f} ms"
+            spaced = all(abs(a['x'] - b['x']) >= b['size'] + gap or abs(a['y'] - b['y']) >= b['size'] + gap
+                         for i, a in enumerate(blocks) for b in blocks[i + 1:])
+            line += f", spacing respected: {spaced}"
+        print(line)
+
+    for count in counts[1:]:
+        random.seed(0)
+        start = time.perf_counter()
+        try:
+            sim.layout_blocks(count, gap, default_area)
+            outcome = "fit"
+        except sim.LayoutError as error:
+            outcome = f"LayoutError: {error}"
+        print(f"{count:>5} blocks in the default area: {outcome} after {(time.perf_counter() - start) * 1000:.2f} ms")
+
+def resident_memory():
+    # Current RSS in bytes (Linux); elsewhere the peak RSS, which still shows growth
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def soak_test(seconds=3600, seed=0, report_every=300):
+    # Endless mode for an hour of game time: RSS, tick time and the block count must not grow.
+    # Reports every report_every seconds of game time, the last report covers whatever is left.
+    if seconds <= 0:
+        raise SystemExit(f"--soak needs a positive number of seconds, not {seconds}")
+    report_every = min(report_every, seconds)
+    sim.game.endless = True
+    sim.start_game("Hard", seed)
+    sim.game.lives = 10 ** 9
+    total_ticks = seconds * sim.tick_rate
+    inputs = scripted_inputs(total_ticks, seed)
+    next_event = 0
+    ticks_per_report = report_every * sim.tick_rate
+    clock = time.perf_counter
+    samples = []
+    print(f"{'game time':>9} {'RSS MB':>8} {'tick us':>8} {'p99 us':>8} {'blocks':>7} {'entities':>9} {'score':>7}")
+    for window_start in range(0, total_ticks, ticks_per_report):
+        window_end = min(window_start + ticks_per_report, total_ticks)
+        tick_times = []
+        for tick in range(window_start, window_end):
+            next_event = apply_inputs(inputs, next_event, tick)
+            start = clock()
+            sim.step_game()
+            tick_times.append(clock() - start)
+        tick_times.sort()
+        sample = (resident_memory() / 2 ** 20, sum(tick_times) / len(tick_times) * 1e6,
+                  tick_times[int(0.99 * len(tick_times))] * 1e6, len(sim.game.blocks))
+        samples.append(sample)
+        print(f"{window_end // sim.tick_rate:>8}s {sample[0]:>8.1f} {sample[1]:>8.1f} {sample[2]:>8.1f} "
+              f"{sample[3]:>7} {sim.game.entities.count():>9} {sim.game.score:>7}")
+    sim.game.endless = False
+
+    # The first window warms up caches and the pool's high-water mark, compare against the second
+    baseline = samples[1] if len(samples) > 2 else samples[0]
+    last = samples[-1]
+    flat = (last[0] - baseline[0] < 2 and last[1] < 1.5 * baseline[1] and
+            max(sample[3] for sample in samples) <= 4 * sim.wave_block_count)
+    print("memory and tick time flat:", flat)
+    return flat
+
+def import_times(targets=("simulation", "headless", "OpenGL.GL, OpenGL.GLUT"), top=6):
+    # Cold-start import cost from python -X importtime, in a fresh interpreter per target,
+    # so regressions in what the game logic drags in show up before anyone notices start-up
+    here = os.path.dirname(os.path.abspath(__file__))
+    for target in targets:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                                capture_output=True, text=True, cwd=here)
+        if result.returncode:
+            print(f"import {target}: failed\n{result.stderr.strip().splitlines()[-1]}")
+            continue
+        total = 0
+        modules = []
+        for line in result.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) != 3 or not parts[0].startswith("import time:") or "cumulative" in parts[1]:
+                continue
+            cumulative = int(parts[1])
+            name = parts[2][1:]
+            if not name.startswith(" "):
+                total += cumulative  # Top-level imports, nested ones are included in their parent
+            modules.append((cumulative, name.strip()))
+        modules.sort(reverse=True)
+        print(f"import {target}: {total / 1000:.1f} ms, {len(modules)} modules")
+        for cumulative, name in modules[:top]:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+def check_allocations(ticks=2000, warmup=300):
+    # Traced memory must not grow from tick to tick, and the transient peak of a
+    # tick must not grow with the number of live entities
+    results = []
+    for name, extra_arrows in (("Hard", 0), ("Hard + 10k arrows", 100)):
+        sim.start_game("Hard", 0)
+        sim.game.lives = 10 ** 9
+        sim.set_key("fire", True)
+        arrow_xs = np.linspace(0, sim.WINDOW_WIDTH, extra_arrows)
+        arrow_speed = sim.difficulty_settings["Hard"]["arrow_speed"] * sim.tick_scale
+
+        def tick(t):
+            # Sweep right and left across the screen, swapping keys every 60 ticks
+            if t % 60 == 0:
+                right = t % 120 == 0
+                sim.set_key("left", not right)
+                sim.set_key("right", right)
+            sim.step_game()
+            if extra_arrows:
+                sim.game.entities.spawn_many(sim.ARROW, arrow_xs, sim.WINDOW_HEIGHT, 0, -arrow_speed)
+
+        for t in range(warmup):
+            tick(t)
+        tracemalloc.start()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        worst_transient = 0
+        for t in range(warmup, warmup + ticks):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            tick(t)
+            worst_transient = max(worst_transient, tracemalloc.get_traced_memory()[1] - before)
+        growth = tracemalloc.get_traced_memory()[0] - start_memory
+        tracemalloc.stop()
+        results.append((growth, worst_transient))
+        print(f"{name:>18}: {sim.game.entities.count():>6} live, net growth {growth} bytes over {ticks} ticks, "
+              f"worst tick peak {worst_transient} bytes")
+
+    # Allow a little slack for interpreter-level caches; a per-entity allocation would be far above this
+    flat = all(growth < 4096 for growth, _ in results) and results[1][1] < 2 * results[0][1] + 4096
+    print("allocations flat:", flat)
+    return flat
+
+def game_state():
+    # What a replay must reproduce exactly
+    game = sim.game
+    return {"tick": game.tick_count, "score": game.score, "lives": game.lives, "blocks": len(game.blocks),
+            "entities": game.entities.count(), "ship x": game.spaceship_x}
+
+def record_session(path, seed, restarts, tail_ticks=500, max_ticks=50000):
+    # Play scripted keys through a Recorder, restarting after each of the first restarts game overs,
+    # then tail_ticks more ticks; returns the final state
+    sim.start_game("Hard", seed)
+    recorder = replay.Recorder(path, seed, "Hard")
+    inputs = scripted_inputs(max_ticks, seed)
+    next_event = 0
+    end_tick = None
+    while sim.game.tick_count < max_ticks and (end_tick is None or sim.game.tick_count < end_tick):
+        if sim.game.game_over_lives or sim.game.game_over_blocks:
+            if not restarts:
+                break
+            recorder.restart()
+            sim.restart_game()
+            restarts -= 1
+            if not restarts:
+                end_tick = sim.game.tick_count + tail_ticks
+        while next_event < len(inputs) and inputs[next_event][0] <= sim.game.tick_count:
+            _, action, down = inputs[next_event]
+            recorder.key(action, down)
+            sim.set_key(action, down)
+            next_event += 1
+        sim.step_game()
+    recorder.close()
+    return game_state()
+
+def replay_session(path, ticks_per_frame, max_frames=100000):
+    # Replay as the window does, ticks_per_frame ticks a frame and none during a game over
+    player = replay.Player(path)
+    player.start()
+    for _ in range(max_frames):
+        if player.finished:
+            break
+        player.advance(0 if sim.game.game_over_lives or sim.game.game_over_blocks else ticks_per_frame)
+    return game_state()
+
+def check_replay(seed=0, restarts=2, rates=(1, 2, 3, 4, 5, 7)):
+    # A recorded session with restarts must replay to the state it was recorded in, however
+    # many ticks each frame advances
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "session.rec")
+        recorded = record_session(path, seed, restarts)
+        print(f"recorded {restarts} restarts:", ", ".join(f"{name} {value}" for name, value in recorded.items()))
+        same = True
+        for rate in rates:
+            replayed = replay_session(path, rate)
+            differences = [f"{name} {replayed[name]} (recorded {value})" for name, value in recorded.items()
+                           if replayed[name] != value]
+            print(f"{rate} ticks/frame:", ", ".join(differences) if differences else "identical")
+            same = same and not differences
+    print("replays identical:", same)
+    return same
+
+def play_sessions(games, ticks):
+    # Step games interleaved one tick at a time, each on its own scripted keys, restarting
+    # after a game over; returns each game's final state
+    streams = [(scripted_inputs(ticks, seed), [0]) for seed, _ in games]
+    for tick in range(ticks):
+        for (_, game), (inputs, next_event) in zip(games, streams):
+            while next_event[0] < len(inputs) and inputs[next_event[0]][0] <= tick:
+                _, action, down = inputs[next_event[0]]
+                game.set_key(action, down)
+                next_event[0] += 1
+            if game.game_over_lives or game.game_over_blocks:
+                game.restart_game()
+            game.step_game()
+    return [(game.tick_count, game.score, game.lives, len(game.blocks), game.entities.count(), game.spaceship_x)
+            for _, game in games]
+
+def check_sessions(count=4, ticks=5000):
+    # Games run side by side (as server.py hosts them) must end exactly where each ends when
+    # run alone, and must not disturb the default game
+    def new_game(seed):
+        game = sim.Game(1024)
+        game.endless = seed % 2 == 1
+        game.start_game(replay.DIFFICULTIES[seed % 3], seed)
+        return seed, game
+
+    sim.start_game("Hard", 0)
+    default_state = game_state()
+    together = play_sessions([new_game(seed) for seed in range(count)], ticks)
+    alone = [play_sessions([new_game(seed)], ticks)[0] for seed in range(count)]
+    for seed, (joint, single) in enumerate(zip(together, alone)):
+        print(f"game {seed}: {'identical' if joint == single else f'{joint} interleaved, {single} alone'}")
+    untouched = game_state() == default_state
+    print("default game untouched:", untouched)
+    same = together == alone and untouched
+    print("sessions independent:", same)
+    return same
+
+def option(name, default):
+    if name in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+def main():
+    sim.game.endless = "--endless" in sys.argv
+    if "--bench" in sys.argv:
+        run_benchmarks(option("--ticks", 2000), option("--seed", 0))
+    elif "--bench-collisions" in sys.argv:
+        sys.exit(0 if benchmark_collisions() else 1)
+    elif "--bench-swept" in sys.argv:
+        sys.exit(0 if benchmark_swept(speed=option("--speed", 1)) else 1)
+    elif "--bench-entities" in sys.argv:
+        benchmark_entities()
+    elif "--bench-spawns" in sys.argv:
+        sys.exit(0 if benchmark_spawns() else 1)
+    elif "--check-allocations" in sys.argv:
+        sys.exit(0 if check_allocations() else 1)
+    elif "--check-replay" in sys.argv:
+        sys.exit(0 if check_replay(option("--seed", 0)) else 1)
+    elif "--check-sessions" in sys.argv:
+        sys.exit(0 if check_sessions() else 1)
+    elif "--bench-layout" in sys.argv:
+        benchmark_layout()
+    elif "--import-times" in sys.argv:
+        import_times()
+    elif "--soak" in sys.argv:
+        args = sys.argv[sys.argv.index("--soak") + 1:]
+        sys.exit(0 if soak_test(int(args[0]) if args and not args[0].startswith("--") else 3600) else 1)
+    elif "--replay" in sys.argv:
+        report = run_replay(option("--replay", ""))
+        print_report(report)
+        print(f"  {report['ticks'] / sim.tick_rate:.1f} s of play replayed "
+              f"{report['ticks'] / sim.tick_rate / report['seconds']:.0f}x faster than real time")
+    else:
+        ticks = option("--ticks", 10000)
+        seed = option("--seed", 0)
+        inputs = load_inputs(option("--inputs", "")) if "--inputs" in sys.argv else None
+        print_report(run_headless(ticks, option("--difficulty", "Hard"), seed, inputs))
+
+if __name__ == "__main__":
+    main()
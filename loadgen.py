@@ -0,0 +1,237 @@
+# Loopback load generator for server.py: opens sessions over a few connections, plays each
+# with random key presses, mirrors every session from the deltas it receives, then asks the
+# server for its tick statistics. The run fails if a mirror disagrees with the server, a
+# connection is lost, the server closes a session or a session stops receiving frames.
+#
+#   python loadgen.py --sessions 200 [--connections 4] [--seconds 20] [--difficulty Hard] [--endless]
+#                     [--port 7777 | --spawn-server [--tick-rate 60]]
+#
+# --spawn-server starts a server on a free loopback port for the run, so the two processes
+# do not share a core's time with each other's work accounted to the wrong side.
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import replay
+import server as protocol
+from headless import option
+
+class MirroredSession:
+    # A client's copy of one session, rebuilt from STATE frames
+    def __init__(self, session_id, seed):
+        self.id = session_id
+        self.rng = random.Random(seed)
+        self.direction = 0
+        self.fire = False
+        self.tick = 0
+        self.entities = {}  # Row -> (kind, x, y, vx, vy, session tick of x, y)
+        self.blocks = {}  # (x, y) -> size
+        self.game_over = False
+        self.restart_sent = False
+        self.mismatches = 0  # Frames after which the mirror's counts disagreed with the server's
+        self.closed = False  # The server sent CLOSED for this session
+        self.last_frame = None  # perf_counter() when the last STATE frame arrived
+
+    def apply(self, payload):
+        header = protocol.STATE_HEADER.unpack_from(payload)
+        tick, _, _, _, flags, live, block_count, _, spawned, killed, removed, added = header
+        offset = protocol.STATE_HEADER.size
+        records = np.frombuffer(payload, dtype=protocol.ENTITY, count=spawned, offset=offset)
+        offset += spawned * protocol.ENTITY.itemsize
+        killed_rows = np.frombuffer(payload, dtype="<u2", count=killed, offset=offset)
+        offset += killed * 2
+        removed_blocks = np.frombuffer(payload, dtype="<i4", count=removed * 2, offset=offset).reshape(-1, 2)
+        offset += removed * 8
+        # Kills first: a row can die and be reused by a new entity in the same tick
+        for row in killed_rows.tolist():
+            self.entities.pop(row, None)
+        for row, kind, x, y, vx, vy in records.tolist():
+            self.entities[row] = (kind, x, y, vx, vy, tick)
+        for x, y in removed_blocks.tolist():
+            self.blocks.pop((x, y), None)
+        for _ in range(added):
+            x, y, size = protocol.BLOCK.unpack_from(payload, offset)
+            offset += protocol.BLOCK.size
+            self.blocks[(x, y)] = size
+        self.tick = tick
+        self.last_frame = time.perf_counter()
+        self.game_over = bool(flags & 0b1100)
+        if not self.game_over:
+            self.restart_sent = False
+        if len(self.entities) != live or len(self.blocks) != block_count:
+            self.mismatches += 1
+
+    def act(self):
+        # Key events to send this tick: random direction and fire changes, and a restart after a game over
+        if self.closed:
+            return []
+        if self.game_over:
+            if self.restart_sent:
+                return []
+            self.restart_sent = True
+            return [replay.RESTART]
+        codes = []
+        if self.rng.random() < 0.05:
+            direction = self.rng.choice((-1, 0, 1))
+            if direction != self.direction:
+                if self.direction:
+                    codes.append(replay.KEYS.index("left" if self.direction < 0 else "right") * 2)
+                if direction:
+                    codes.append(replay.KEYS.index("left" if direction < 0 else "right") * 2 + 1)
+                self.direction = direction
+        if self.rng.random() < 0.05:
+            self.fire = not self.fire
+            codes.append(replay.KEYS.index("fire") * 2 + int(self.fire))
+        return codes
+
+class Client:
+    # One connection hosting a share of the sessions
+    def __init__(self, reader, writer, sessions):
+        self.reader = reader
+        self.writer = writer
+        self.sessions = {session.id: session for session in sessions}
+        self.tick_times = []  # Arrival time of each TICK frame
+        self.frames = 0
+        self.bytes = 0
+        self.stats = None
+        self.lost = False  # The connection ended before the run did
+        self.stalled = 0  # Open sessions that received no frame over the end of the run
+
+    async def receive(self):
+        # Parse frames out of whatever arrived; partial frames wait in the buffer for the rest
+        buffer = b""
+        while True:
+            data = await self.reader.read(1 << 16)
+            if not data:
+                return
+            self.bytes += len(data)
+            buffer += data
+            offset = 0
+            while offset < len(buffer):
+                kind = buffer[offset]
+                if kind == protocol.TICK:
+                    if len(buffer) - offset < protocol.TICK_FRAME.size:
+                        break
+                    offset += protocol.TICK_FRAME.size
+                    self.tick_times.append(time.perf_counter())
+                    self.send_keys()
+                elif kind == protocol.STATE:
+                    if len(buffer) - offset < protocol.STATE_FRAME.size:
+                        break
+                    _, session_id, length = protocol.STATE_FRAME.unpack_from(buffer, offset)
+                    end = offset + protocol.STATE_FRAME.size + length
+                    if end > len(buffer):
+                        break
+                    self.sessions[session_id].apply(buffer[offset + protocol.STATE_FRAME.size:end])
+                    self.frames += 1
+                    offset = end
+                elif kind == protocol.STATS:
+                    if len(buffer) - offset < protocol.STATS_FRAME.size:
+                        break
+                    _, length = protocol.STATS_FRAME.unpack_from(buffer, offset)
+                    end = offset + protocol.STATS_FRAME.size + length
+                    if end > len(buffer):
+                        break
+                    self.stats = buffer[offset + protocol.STATS_FRAME.size:end].decode()
+                    offset = end
+                elif kind == protocol.CLOSED:
+                    if len(buffer) - offset < protocol.CLOSED_FRAME.size:
+                        break
+                    _, session_id = protocol.CLOSED_FRAME.unpack_from(buffer, offset)
+                    offset += protocol.CLOSED_FRAME.size
+                    self.sessions[session_id].closed = True
+                else:
+                    raise ValueError(f"unexpected frame type {kind}")
+            buffer = buffer[offset:]
+
+    def send_keys(self):
+        messages = [protocol.KEY_MESSAGE.pack(protocol.KEY, session.id, code)
+                    for session in self.sessions.values() for code in session.act()]
+        if messages:
+            self.writer.write(b"".join(messages))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def connect(port, attempts=100):
+    # The spawned server needs a moment to start listening
+    for _ in range(attempts):
+        try:
+            return await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise SystemExit(f"no server on port {port}")
+
+async def run_load(port, sessions, connections, seconds, difficulty, endless, stall_seconds=5):
+    clients = []
+    for c in range(connections):
+        reader, writer = await connect(port)
+        mirrored = [MirroredSession(i, i) for i in range(c, sessions, connections)]
+        writer.write(b"".join(protocol.NEW_MESSAGE.pack(protocol.NEW, session.id, session.id,
+                                                        replay.DIFFICULTIES.index(difficulty), endless)
+                              for session in mirrored))
+        clients.append(Client(reader, writer, mirrored))
+    receivers = [asyncio.create_task(client.receive()) for client in clients]
+    await asyncio.sleep(seconds)
+    since = time.perf_counter() - min(stall_seconds, seconds)
+    for client, receiver in zip(clients, receivers):
+        client.lost = receiver.done()
+        client.stalled = sum(not session.closed and (session.last_frame is None or session.last_frame < since)
+                             for session in client.sessions.values())
+
+    clients[0].writer.write(protocol.STATS_MESSAGE.pack(protocol.STATS))
+    while clients[0].stats is None and not receivers[0].done():
+        await asyncio.sleep(0.05)
+    for client in clients:
+        client.writer.close()
+    for receiver in receivers:
+        receiver.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    return clients
+
+def report(clients, seconds):
+    stats = clients[0].stats and json.loads(clients[0].stats)
+    if stats:
+        print("server:", protocol.format_stats(stats))
+    gaps = sorted(np.diff(clients[0].tick_times)) if len(clients[0].tick_times) > 1 else [0.0]
+    frames = sum(client.frames for client in clients)
+    received = sum(client.bytes for client in clients)
+    mismatches = sum(session.mismatches for client in clients for session in client.sessions.values())
+    lost = sum(client.lost for client in clients)
+    closed = sum(session.closed for client in clients for session in client.sessions.values())
+    stalled = sum(client.stalled for client in clients)
+    print(f"client: {frames / seconds:.0f} state frames/s, {received / seconds / 1024:.0f} KB/s, "
+          f"tick arrival gap p50 {gaps[len(gaps) // 2] * 1000:.1f} ms p99 {gaps[int(0.99 * len(gaps))] * 1000:.1f} ms, "
+          f"mirror mismatches {mismatches}, lost connections {lost}, sessions closed {closed}, stalled {stalled}")
+    return mismatches == 0 and lost == 0 and closed == 0 and stalled == 0
+
+def main():
+    sessions = option("--sessions", 200)
+    seconds = option("--seconds", 20)
+    port = option("--port", 7777)
+    server_process = None
+    if "--spawn-server" in sys.argv:
+        port = free_port()
+        here = os.path.dirname(os.path.abspath(__file__))
+        server_process = subprocess.Popen([sys.executable, os.path.join(here, "server.py"), "--port", str(port),
+                                           "--tick-rate", str(option("--tick-rate", 60)), "--report", "0"])
+    try:
+        clients = asyncio.run(run_load(port, sessions, option("--connections", 4), seconds,
+                                       option("--difficulty", "Hard"), "--endless" in sys.argv))
+    finally:
+        if server_process:
+            server_process.terminate()
+            server_process.wait()
+    sys.exit(0 if report(clients, seconds) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Rolling per-frame timings for the profiling overlay (toggle with 'p' in game).
+# Phases are timed with "with profiler.phase(name):", which costs almost nothing
+# while profiling is off.
+import json
+import time
+from collections import deque
+
+PHASES = ("update", "spawn", "collide", "draw", "hud", "flush")  # In the order they run
+
+enabled = False
+window = 240  # Frames kept for the rolling averages and percentiles
+
+frame_phases = {}  # phase -> seconds spent in it during the current frame
+phase_history = {}  # phase -> deque of milliseconds per frame
+frame_history = deque(maxlen=window)  # Whole-frame milliseconds
+gl_calls = 0  # GL calls issued during the current frame
+gl_call_history = deque(maxlen=window)
+input_latency_history = deque(maxlen=window)  # Milliseconds from key press to the frame showing it
+input_latency = None  # Latest sample not yet written to the log
+entity_counts = {}  # Latest live counts, filled in by the caller
+frame_count = 0
+
+log_file = None
+log_format = None  # "csv" or "jsonl"
+log_columns = None
+
+class Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter() if enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            frame_phases[self.name] = frame_phases.get(self.name, 0.0) + time.perf_counter() - self.start
+
+phases = {}
+
+def phase(name):
+    # Phase objects are reused so timing a phase allocates nothing
+    timer = phases.get(name)
+    if timer is None:
+        timer = phases[name] = Phase(name)
+    return timer
+
+def toggle():
+    global enabled
+    enabled = not enabled
+    reset()
+
+def reset():
+    global gl_calls, input_latency
+    frame_phases.clear()
+    phase_history.clear()
+    frame_history.clear()
+    gl_call_history.clear()
+    input_latency_history.clear()
+    gl_calls = 0
+    input_latency = None
+
+def record_input_latency(seconds):
+    # Measured after the buffer swap, so it lands in the log row of the next frame
+    global input_latency
+    input_latency = seconds * 1000
+    input_latency_history.append(input_latency)
+
+def open_log(path):
+    # Write one row per profiled frame; the format follows the file extension
+    global log_file, log_format, enabled
+    log_file = open(path, "w", buffering=1)  # Line buffered, GLUT never returns to close it
+    log_format = "jsonl" if path.endswith(".jsonl") else "csv"
+    enabled = True
+
+def end_frame(frame_seconds, counts):
+    global gl_calls, frame_count
+    frame_count += 1
+    frame_history.append(frame_seconds * 1000)
+    gl_call_history.append(gl_calls)
+    for name in PHASES:
+        history = phase_history.get(name)
+        if history is None:
+            history = phase_history[name] = deque(maxlen=window)
+        history.append(frame_phases.get(name, 0.0) * 1000)
+    entity_counts.clear()
+    entity_counts.update(counts)
+    if log_file is not None:
+        write_log_row(frame_seconds)
+    frame_phases.clear()
+    gl_calls = 0
+
+def write_log_row(frame_seconds):
+    global log_columns, input_latency
+    row = {"frame": frame_count, "time": round(time.time(), 3), "frame_ms": round(frame_seconds * 1000, 3),
+           "gl_calls": gl_calls}
+    for name in PHASES:
+        row[name + "_ms"] = round(phase_history[name][-1], 3)
+    row["input_latency_ms"] = None if input_latency is None else round(input_latency, 3)
+    input_latency = None
+    row.update(entity_counts)
+    if log_format == "jsonl":
+        log_file.write(json.dumps(row) + "\n")
+        return
+    if log_columns is None:
+        log_columns = list(row)
+        log_file.write(",".join(log_columns) + "\n")
+    values = (row.get(column) for column in log_columns)
+    log_file.write(",".join("" if value is None else str(value) for value in values) + "\n")
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summary_lines():
+    # Text for the on-screen overlay
+    frames = list(frame_history)
+    lines = [
+        f"frame p50 {percentile(frames, 0.5):.2f}  p95 {percentile(frames, 0.95):.2f}  "
+        f"p99 {percentile(frames, 0.99):.2f}  max {max(frames, default=0.0):.2f} ms",
+        "  ".join(f"{name} {sum(history) / len(history):.2f}" for name, history in phase_history.items()) + " ms avg",
+        f"GL calls {gl_call_history[-1] if gl_call_history else 0}  " +
+        "  ".join(f"{name} {count}" for name, count in entity_counts.items()),
+    ]
+    if input_latency_history:
+        latencies = list(input_latency_history)
+        lines.append(f"input latency p50 {percentile(latencies, 0.5):.1f}  p99 {percentile(latencies, 0.99):.1f}  "
+                     f"max {max(latencies):.1f} ms ({len(latencies)} presses)")
+    return lines
@@ -0,0 +1,90 @@
+# Record and replay of game sessions. A recording holds the RNG seed, difficulty and
+# tick rate, then every input change stamped with the number of ticks run before it,
+# so replaying it reruns the session tick for tick. Imports no OpenGL.
+#
+# Format (little endian): a header "<4sBQHBB" (magic, version, seed, tick rate,
+# difficulty, endless), then 5-byte events "<IB" (tick, code) appended as they happen.
+# A recording cut off mid-write is still valid up to its last whole event.
+import struct
+
+import simulation as sim
+
+MAGIC = b"SSRP"
+VERSION = 3  # 3: spawns drawn by the scheduler, older recordings replay differently
+HEADER = struct.Struct("<4sBQHBB")
+EVENT = struct.Struct("<IB")
+
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+KEYS = ("left", "right", "fire")  # Key events are coded as index * 2 + (1 if down else 0)
+RESTART = 6
+END = 7
+
+class Recorder:
+    def __init__(self, path, seed, difficulty):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, sim.tick_rate, DIFFICULTIES.index(difficulty), sim.game.endless))
+        self.file.flush()
+
+    def key(self, action, down):
+        self.write(KEYS.index(action) * 2 + int(down))
+
+    def restart(self):
+        self.write(RESTART)
+
+    def close(self):
+        if not self.file.closed:
+            self.write(END)
+            self.file.close()
+
+    def write(self, code):
+        # Flushed per event, they are rare and a crash should not lose the session
+        self.file.write(EVENT.pack(sim.game.tick_count, code))
+        self.file.flush()
+
+class Player:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, self.seed, self.tick_rate, difficulty, endless = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} recording")
+        self.difficulty = DIFFICULTIES[difficulty]
+        self.endless = bool(endless)
+        body = data[HEADER.size:]
+        self.events = list(EVENT.iter_unpack(body[:len(body) - len(body) % EVENT.size]))
+        # Without an END event (the game was killed) the session stops at the last input
+        self.end_tick = self.events[-1][0] if self.events else 0
+        self.next_event = 0
+        self.finished = False
+
+    def start(self):
+        sim.set_tick_rate(self.tick_rate)
+        sim.game.endless = self.endless
+        sim.start_game(self.difficulty, self.seed)
+        self.next_event = 0
+        self.finished = False
+
+    def apply_events(self):
+        # Feed every input due before the next tick; False once the session is over
+        while self.next_event < len(self.events) and self.events[self.next_event][0] <= sim.game.tick_count:
+            code = self.events[self.next_event][1]
+            self.next_event += 1
+            if code == RESTART:
+                sim.restart_game()
+            elif code != END:
+                sim.set_key(KEYS[code // 2], bool(code % 2))
+        # No ticks run during a game over, so a restart after one carries the same stamp
+        # and has already been applied above
+        self.finished = sim.game.tick_count >= self.end_tick or sim.game.game_over_lives or sim.game.game_over_blocks
+        return not self.finished
+
+    def advance(self, ticks):
+        # Run up to ticks recorded ticks, for rendering a replay a few ticks per frame. The inputs
+        # due before the next tick are applied even for 0 ticks, which is how a restart recorded
+        # during a game over (when no ticks run) is picked up.
+        if not self.apply_events():
+            return
+        for _ in range(ticks):
+            sim.step_game()
+            if not self.apply_events():
+                break
@@ -0,0 +1,301 @@
+# Authoritative game server: hosts many game sessions in one process, steps them all on a
+# shared tick, takes key events and sends each client what changed. Imports no OpenGL.
+#
+#   python server.py [--host 127.0.0.1] [--port 7777] [--tick-rate 60] [--capacity 1024] [--report 10]
+#
+# A server runs on one core; start one per core (on different ports) to use more.
+# loadgen.py drives it with loopback clients and reports sessions per core and p99 tick time.
+#
+# Protocol, little endian over TCP. A connection can host any number of sessions, which the
+# client numbers itself.
+#   client -> server  NEW "<BIQBB" (type, session, seed, difficulty, endless)
+#                     KEY "<BIB" (type, session, code), codes as in replay.py; RESTART restarts the game
+#                     CLOSE "<BI" (type, session)
+#                     STATS "<B": the server answers with a STATS frame
+#   server -> client  TICK "<BI" (type, server tick), once per tick ahead of that tick's session frames
+#                     STATE "<BII" (type, session, payload length) + payload, for sessions that changed:
+#                         STATE_HEADER, then the spawned entities (ENTITY), the killed rows ("<u2"),
+#                         the blocks removed ("<ii" x, y) and the blocks added ("<iiB" x, y, size)
+#                     STATS "<BI" (type, length) + JSON
+#                     CLOSED "<BI" (type, session), for a session the server closed: a NEW it could not
+#                         start (unknown difficulty, game failed to start) or a session whose tick failed
+# Entities fly in straight lines, so a spawn carries its position and velocity at the session
+# tick in the header and the client moves it on by itself (x + vx * ticks); after that only its
+# kill is sent. A session whose game is over changes nothing and sends nothing. An error in one
+# session closes only that session; the other sessions on the connection and the server go on.
+import asyncio
+import json
+import struct
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+import replay
+import simulation as sim
+from headless import option
+
+NEW, KEY, CLOSE, STATS, TICK, STATE, CLOSED = range(1, 8)
+NEW_MESSAGE = struct.Struct("<BIQBB")
+KEY_MESSAGE = struct.Struct("<BIB")
+CLOSE_MESSAGE = struct.Struct("<BI")
+STATS_MESSAGE = struct.Struct("<B")
+MESSAGES = {NEW: NEW_MESSAGE, KEY: KEY_MESSAGE, CLOSE: CLOSE_MESSAGE, STATS: STATS_MESSAGE}
+TICK_FRAME = struct.Struct("<BI")
+STATE_FRAME = struct.Struct("<BII")
+STATS_FRAME = struct.Struct("<BI")
+CLOSED_FRAME = struct.Struct("<BI")
+# Session tick, score, lives, spaceship x, flags (FLAGS bits), live entities, blocks, field scroll,
+# then how many entities spawned and died and how many blocks went and came
+STATE_HEADER = struct.Struct("<IIihBHHfHHHH")
+FLAGS = ("three_way_shoot", "invincible", "game_over_lives", "game_over_blocks")
+# Spawned entities; rows are 16 bits, so --capacity is at most 65536
+ENTITY = np.dtype([("row", "<u2"), ("kind", "u1"), ("x", "<f4"), ("y", "<f4"), ("vx", "<f4"), ("vy", "<f4")])
+BLOCK = struct.Struct("<iiB")
+
+max_write_buffer = 1 << 20  # Bytes queued for a client that stopped reading before it is dropped
+
+class HostedSession:
+    # A session's game and what its client has been sent so far
+    def __init__(self, session_id, game):
+        capacity = game.entities.capacity
+        self.id = session_id
+        self.game = game
+        self.keys = []  # Codes received since the last tick
+        self.sent_alive = np.zeros(capacity, dtype=bool)
+        self.sent_serial = np.zeros(capacity, dtype=np.uint32)
+        self.sent_used = 0
+        self.sent_changes = -1  # EntityPool.changes when the entities were last diffed
+        self.sent_header = None
+        self.sent_blocks = {}  # (x, y) -> size
+        self.sent_blocks_version = -1
+
+def apply_key(game, code):
+    # A replay-coded key event
+    if code == replay.RESTART:
+        game.restart_game()
+    elif code // 2 < len(replay.KEYS):
+        game.set_key(replay.KEYS[code // 2], bool(code % 2))
+
+def state_frame(hosted):
+    # What changed in the session's game since the last frame sent for it, or None if nothing did
+    game = hosted.game
+    entities = game.entities
+    spawned = killed = ()
+    if entities.changes != hosted.sent_changes:
+        n = max(entities.used, hosted.sent_used)
+        alive = entities.alive[:n]
+        sent_alive = hosted.sent_alive[:n]
+        changed = entities.serial[:n] != hosted.sent_serial[:n]
+        spawned = (alive & changed).nonzero()[0]
+        killed = (sent_alive & (changed | ~alive)).nonzero()[0]
+        sent_alive[:] = alive
+        hosted.sent_serial[:n] = entities.serial[:n]
+        hosted.sent_used = entities.used
+        hosted.sent_changes = entities.changes
+
+    removed = added = ()
+    if game.blocks_version != hosted.sent_blocks_version:
+        blocks = {(block['x'], block['y']): block['size'] for block in game.blocks}
+        removed = [key for key in hosted.sent_blocks if key not in blocks]
+        added = [(x, y, size) for (x, y), size in blocks.items() if (x, y) not in hosted.sent_blocks]
+        hosted.sent_blocks = blocks
+        hosted.sent_blocks_version = game.blocks_version
+
+    flags = sum(1 << bit for bit, name in enumerate(FLAGS) if getattr(game, name))
+    header = (game.score, game.lives, int(game.spaceship_x), flags)
+    if header == hosted.sent_header and not (len(spawned) or len(killed) or removed or added):
+        return None
+    hosted.sent_header = header
+
+    parts = [STATE_HEADER.pack(game.tick_count, *header, entities.count(), len(game.blocks), game.field_scroll,
+                               len(spawned), len(killed), len(removed), len(added))]
+    if len(spawned):
+        records = np.empty(len(spawned), dtype=ENTITY)
+        records["row"] = spawned
+        records["kind"] = entities.kind[spawned]
+        records["x"] = entities.x[spawned]
+        records["y"] = entities.y[spawned]
+        records["vx"] = entities.vx[spawned]
+        records["vy"] = entities.vy[spawned]
+        parts.append(records.tobytes())
+    if len(killed):
+        parts.append(killed.astype("<u2").tobytes())
+    if removed:
+        parts.append(np.array(removed, dtype="<i4").tobytes())
+    parts.extend(BLOCK.pack(*block) for block in added)
+    payload = b"".join(parts)
+    return STATE_FRAME.pack(STATE, hosted.id, len(payload)) + payload
+
+def start_session(session_id, seed, difficulty, endless, capacity):
+    # A started game for a NEW message, or None if its fields are invalid or the game fails to start
+    if difficulty >= len(replay.DIFFICULTIES) or endless > 1:
+        print(f"session {session_id} refused: difficulty {difficulty}, endless {endless}", file=sys.stderr)
+        return None
+    game = sim.Game(capacity)
+    game.endless = bool(endless)
+    try:
+        game.start_game(replay.DIFFICULTIES[difficulty], seed)
+    except Exception as error:
+        print(f"session {session_id} failed to start: {error!r}", file=sys.stderr)
+        return None
+    return game
+
+class Connection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.sessions = {}  # Client-chosen id -> HostedSession
+
+class Server:
+    def __init__(self, tick_rate=60, capacity=1024, window_seconds=10):
+        sim.set_tick_rate(tick_rate)
+        self.capacity = capacity
+        self.connections = set()
+        self.tick = 0
+        self.window = window_seconds * tick_rate
+        self.tick_seconds = deque(maxlen=self.window)  # Wall time spent stepping and encoding, per tick
+        self.tick_cpu_seconds = deque(maxlen=self.window)  # The same in CPU time, without time lost to other processes
+        self.tick_sessions = deque(maxlen=self.window)
+        self.late_ticks = deque(maxlen=self.window)  # 1 where a tick started a whole tick late
+        self.cpu_samples = deque(maxlen=self.window)  # (wall clock, process time) at each tick
+        self.bytes_sent = deque(maxlen=self.window)
+
+    def session_count(self):
+        return sum(len(connection.sessions) for connection in self.connections)
+
+    async def handle(self, reader, writer):
+        connection = Connection(writer)
+        self.connections.add(connection)
+        try:
+            while True:
+                kind = await reader.readexactly(1)
+                message = MESSAGES.get(kind[0])
+                if message is None:
+                    break  # Not speaking this protocol
+                kind, *fields = message.unpack(kind + await reader.readexactly(message.size - 1))
+                if kind == NEW:
+                    session_id, seed, difficulty, endless = fields
+                    connection.sessions.pop(session_id, None)
+                    game = start_session(session_id, seed, difficulty, endless, self.capacity)
+                    if game:
+                        connection.sessions[session_id] = HostedSession(session_id, game)
+                    else:
+                        writer.write(CLOSED_FRAME.pack(CLOSED, session_id))
+                elif kind == KEY:
+                    hosted = connection.sessions.get(fields[0])
+                    if hosted:
+                        hosted.keys.append(fields[1])
+                elif kind == CLOSE:
+                    connection.sessions.pop(fields[0], None)
+                else:
+                    stats = json.dumps(self.stats()).encode()
+                    writer.write(STATS_FRAME.pack(STATS, len(stats)) + stats)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+
+    def step(self):
+        # One shared tick: every session runs one game tick and its changes go out in one write per client
+        self.tick += 1
+        sent = 0
+        for connection in list(self.connections):
+            frames = [TICK_FRAME.pack(TICK, self.tick)]
+            failed = []
+            for hosted in connection.sessions.values():
+                game = hosted.game
+                try:
+                    for code in hosted.keys:
+                        apply_key(game, code)
+                    hosted.keys.clear()
+                    if not (game.game_over_lives or game.game_over_blocks):
+                        game.step_game()
+                    frame = state_frame(hosted)
+                except Exception as error:
+                    print(f"session {hosted.id} closed at tick {game.tick_count}: {error!r}", file=sys.stderr)
+                    failed.append(hosted.id)
+                    frames.append(CLOSED_FRAME.pack(CLOSED, hosted.id))
+                    continue
+                if frame:
+                    frames.append(frame)
+            for session_id in failed:
+                del connection.sessions[session_id]
+            data = b"".join(frames)
+            sent += len(data)
+            connection.writer.write(data)
+            if connection.writer.transport.get_write_buffer_size() > max_write_buffer:
+                connection.writer.close()
+                self.connections.discard(connection)
+        return sent
+
+    async def run(self, host, port, report_every=10):
+        listener = await asyncio.start_server(self.handle, host, port)
+        print(f"serving on {host}:{port} at {sim.tick_rate} ticks/s", file=sys.stderr)
+        loop = asyncio.get_running_loop()
+        tick_length = 1.0 / sim.tick_rate
+        deadline = loop.time()
+        next_report = self.tick + report_every * sim.tick_rate
+        async with listener:
+            while True:
+                # Ticks keep to deadlines; after falling a whole tick behind the backlog is dropped
+                deadline += tick_length
+                delay = deadline - loop.time()
+                late = delay < -tick_length
+                if late:
+                    deadline = loop.time()
+                await asyncio.sleep(max(delay, 0))
+                start = time.perf_counter()
+                cpu_start = time.process_time()
+                sent = self.step()
+                self.tick_cpu_seconds.append(time.process_time() - cpu_start)
+                self.tick_seconds.append(time.perf_counter() - start)
+                self.tick_sessions.append(self.session_count())
+                self.late_ticks.append(late)
+                self.cpu_samples.append((time.perf_counter(), time.process_time()))
+                self.bytes_sent.append(sent)
+                if report_every and self.tick >= next_report:
+                    next_report += report_every * sim.tick_rate
+                    print(format_stats(self.stats()), file=sys.stderr)
+
+    def stats(self):
+        # Over the last window_seconds: tick time percentiles, how busy the core was and how
+        # many sessions a core would hold at this tick rate if ticks used all of it
+        if len(self.tick_seconds) < 2:
+            return {"ticks": self.tick, "sessions": self.session_count()}
+        times = sorted(self.tick_seconds)
+        wall = self.cpu_samples[-1][0] - self.cpu_samples[0][0]
+        cpu = self.cpu_samples[-1][1] - self.cpu_samples[0][1]
+        tick_cpu = sum(self.tick_cpu_seconds) / len(self.tick_cpu_seconds)
+        sessions = sum(self.tick_sessions) / len(self.tick_sessions)
+        return {
+            "ticks": self.tick,
+            "tick_rate": sim.tick_rate,
+            "sessions": self.session_count(),
+            "tick_ms_p50": round(times[len(times) // 2] * 1000, 3),
+            "tick_ms_p99": round(times[int(0.99 * len(times))] * 1000, 3),
+            "tick_ms_max": round(times[-1] * 1000, 3),
+            "late_ticks": sum(self.late_ticks),
+            "cpu_busy": round(cpu / wall, 3) if wall else 0.0,
+            "sessions_per_core": round(sessions / (tick_cpu * sim.tick_rate)) if tick_cpu else 0,
+            "send_kb_per_s": round(sum(self.bytes_sent) / wall / 1024, 1) if wall else 0.0,
+        }
+
+def format_stats(stats):
+    if "tick_ms_p99" not in stats:
+        return f"tick {stats['ticks']}: {stats['sessions']} sessions"
+    return (f"tick {stats['ticks']}: {stats['sessions']} sessions, tick p50 {stats['tick_ms_p50']:.2f} ms "
+            f"p99 {stats['tick_ms_p99']:.2f} ms max {stats['tick_ms_max']:.2f} ms, {stats['late_ticks']} late, "
+            f"cpu {stats['cpu_busy']:.0%}, ~{stats['sessions_per_core']} sessions/core, "
+            f"{stats['send_kb_per_s']:.0f} KB/s sent")
+
+def main():
+    server = Server(option("--tick-rate", 60), option("--capacity", 1024))
+    try:
+        asyncio.run(server.run(option("--host", "127.0.0.1"), option("--port", 7777), option("--report", 10)))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,969 @@
+# Game simulation: state, movement, spawning and collisions.
+# Nothing here touches OpenGL, so it can run headless (see headless.py).
+#
+# A Game holds one game's state and the steps that advance it. Settings such as tick_rate
+# and difficulty_settings are module-level and shared by every game. The module-level
+# functions at the bottom run the default game, sim.game, for callers that play one game
+# at a time; server.py keeps a Game per session.
+import random
+import math
+import time
+import heapq
+from collections import deque
+import numpy as np
+
+import profiler
+
+# Window dimensions
+WINDOW_WIDTH = 900
+WINDOW_HEIGHT = 700
+
+# Stars: a fixed pattern that scrolls down as one layer and wraps around
+num_stars = 130
+star_speed = 2
+
+# Spaceship
+spaceship_y = 50
+spaceship_width = 40
+spaceship_height = 30
+spaceship_speed = 13  # Pixels per move_spaceship() call
+spaceship_hold_speed = 6  # Pixels per tick at BASE_TICK_RATE while a direction key is held
+
+# Bullets
+bullet_speed = 15
+bullet_length = 5
+power_up_duration = 10  # Seconds of game time a power-up lasts
+fire_interval = 0.15  # Seconds between shots while fire is held
+
+# Blocks
+block_sizes = [20, 30, 40]
+block_count = 20  # Blocks laid out by init_game()
+block_gap = 50  # Minimum free space between blocks, lower it for denser layouts
+layout_attempts = 30  # Random draws per block before a layout step gives up, see layout_blocks()
+layout_scan_limit = 1 << 22  # Largest area (in pixels) searched exhaustively when random draws find no room
+layout_restarts = 10  # Fresh layouts tried when earlier blocks left no room for the rest
+
+# Endless mode: waves of blocks are laid out above the screen and scroll down into view.
+# Blocks keep field coordinates; the screen shows field y from field_scroll upwards.
+field_speed = 1  # Pixels per tick at BASE_TICK_RATE
+wave_height = WINDOW_HEIGHT // 2
+wave_block_count = 15  # Blocks per wave
+grid_cell_size = max(block_sizes)
+
+# Falling hearts
+heart_size = 17
+
+# Falling arrows
+arrow_size = 18
+
+# Power-ups
+power_up_size = 18
+power_up_speed = 5
+power_up_spawn_rate = 0.003  # Reduced spawn rate for power-ups
+
+# Entity kinds stored in the entity pool
+BULLET, HEART, ARROW, POWER_UP = range(4)
+
+class EntityPool:
+    # Fixed-capacity structure-of-arrays storage for every moving object, one row per entity.
+    # Columns, the free-row stack and the scratch masks are allocated once up front, so
+    # spawning, culling and collision checks reuse memory instead of allocating per tick.
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.prev_x = np.zeros(capacity)  # Position at the previous tick, for interpolation
+        self.prev_y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.serial = np.zeros(capacity, dtype=np.uint32)  # Bumped on every spawn, tells a reused row from its old entity
+        self.rows = np.arange(capacity, dtype=np.intp)
+        self.free = np.zeros(capacity, dtype=np.intp)  # Stack of free rows, popped from the top
+        self.free_count = 0
+        self.used = 0  # Rows at or above this index have never been used since clear()
+        self.dropped = 0  # Spawns refused because the pool was full
+        self.changes = 0  # Bumped by every spawn, kill and clear, so a caller can tell nothing changed
+        # Scratch buffers for per-tick masks and temporaries
+        self.mask = np.zeros(capacity, dtype=bool)
+        self.mask2 = np.zeros(capacity, dtype=bool)
+        self.mask3 = np.zeros(capacity, dtype=bool)
+        self.scratch = np.zeros(capacity)
+        self.scratch2 = np.zeros(capacity)
+        self.clear()
+
+    def clear(self):
+        self.alive[:] = False
+        self.vx[:] = 0
+        self.vy[:] = 0
+        self.free[:] = self.rows[::-1]
+        self.free_count = self.capacity
+        self.used = 0
+        self.changes += 1
+
+    def spawn(self, kind, x, y, vx=0.0, vy=0.0):
+        if self.free_count == 0:
+            self.dropped += 1
+            return -1
+        self.free_count -= 1
+        i = int(self.free[self.free_count])
+        if i >= self.used:
+            self.used = i + 1
+        self.x[i] = self.prev_x[i] = x
+        self.y[i] = self.prev_y[i] = y
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.kind[i] = kind
+        self.serial[i] += 1
+        self.alive[i] = True
+        self.changes += 1
+        return i
+
+    def spawn_many(self, kind, xs, ys, vx=0.0, vy=0.0):
+        # Vectorized spawn of len(xs) entities sharing one kind and velocity; ys may be a scalar
+        count = min(len(xs), self.free_count)
+        self.dropped += len(xs) - count
+        if count == 0:
+            return self.free[:0]
+        if count < len(xs):
+            xs = xs[:count]
+            ys = ys if np.isscalar(ys) else ys[:count]
+        rows = self.free[self.free_count - count:self.free_count][::-1]
+        self.free_count -= count
+        self.used = max(self.used, int(rows[-1]) + 1)
+        self.x[rows] = xs
+        self.prev_x[rows] = xs
+        self.y[rows] = ys
+        self.prev_y[rows] = ys
+        self.vx[rows] = vx
+        self.vy[rows] = vy
+        self.kind[rows] = kind
+        self.serial[rows] += 1
+        self.alive[rows] = True
+        self.changes += 1
+        return rows
+
+    def kill(self, indices):
+        # indices must be unique rows that are currently alive
+        indices = np.asarray(indices, dtype=np.intp)
+        self.alive[indices] = False
+        self.vx[indices] = 0
+        self.vy[indices] = 0
+        self.free[self.free_count:self.free_count + len(indices)] = indices[::-1]
+        self.free_count += len(indices)
+        self.changes += len(indices) > 0
+
+    def kill_mask(self, mask):
+        # Kill every row set in mask (a mask over rows[:used], only covering live rows)
+        count = int(np.count_nonzero(mask))
+        if count:
+            n = self.used
+            np.compress(mask, self.rows[:n], out=self.free[self.free_count:self.free_count + count])
+            self.free_count += count
+            self.changes += 1
+            np.logical_xor(self.alive[:n], mask, out=self.alive[:n])
+            np.copyto(self.vx[:n], 0.0, where=mask)
+            np.copyto(self.vy[:n], 0.0, where=mask)
+        return count
+
+    def select(self, kind, out):
+        # Mask of live rows of one kind, written into out[:used]
+        n = self.used
+        selected = np.equal(self.kind[:n], kind, out=out[:n])
+        return np.logical_and(selected, self.alive[:n], out=selected)
+
+    def positions(self, indices, alpha=1.0):
+        # Positions blended between the previous and the latest tick
+        x = self.x[indices]
+        y = self.y[indices]
+        if alpha == 1.0:
+            return x, y
+        prev_x = self.prev_x[indices]
+        prev_y = self.prev_y[indices]
+        return prev_x + (x - prev_x) * alpha, prev_y + (y - prev_y) * alpha
+
+    def indices(self, kind):
+        # Only the returned rows are allocated, the selection mask lives in a scratch buffer
+        return np.flatnonzero(self.select(kind, self.mask3))
+
+    def count(self, kind=None):
+        if kind is None:
+            return int(np.count_nonzero(self.alive[:self.used]))
+        return int(np.count_nonzero(self.select(kind, self.mask3)))
+
+# Difficulty settings
+difficulty_settings = {
+    "Easy": {"heart_speed": 3, "heart_spawn_rate": 0.003, "arrow_speed": 3, "arrow_spawn_rate": 0.03},
+    "Medium": {"heart_speed": 5, "heart_spawn_rate": 0.002, "arrow_speed": 5, "arrow_spawn_rate": 0.07},
+    "Hard": {"heart_speed": 6, "heart_spawn_rate": 0.001, "arrow_speed": 7, "arrow_spawn_rate": 0.1}
+}
+
+# Collisions test the path an object covered during the tick, not only where it ended up,
+# so fast objects and long ticks cannot skip past a block or the ship
+swept_collisions = True  # False tests only the latest positions, as before, for comparison
+
+# Timing: speeds and spawn rates above are per tick at BASE_TICK_RATE
+BASE_TICK_RATE = 60
+tick_rate = BASE_TICK_RATE  # Simulation ticks per second
+tick_scale = 1.0  # BASE_TICK_RATE / tick_rate, multiplies every per-tick speed
+max_ticks_per_frame = 5  # Drop the backlog instead of spiralling when a frame runs long
+
+def set_tick_rate(rate):
+    global tick_rate, tick_scale
+    tick_rate = rate
+    tick_scale = BASE_TICK_RATE / rate
+
+def tick_chance(rate):
+    # Per-tick probability with the same expected spawns per second as rate at BASE_TICK_RATE
+    return 1 - (1 - rate) ** tick_scale
+
+def power_up_ticks():
+    # A power-up ends on the first tick more than power_up_duration seconds of game time after pickup
+    return int(power_up_duration * tick_rate) + 1
+
+class LayoutError(Exception):
+    # The requested blocks do not fit in the layout area. The counts are the exception's args,
+    # so it pickles, e.g. back from a batch.py worker.
+    def __init__(self, placed, count):
+        super().__init__(placed, count)
+        self.placed = placed
+        self.count = count
+
+    def __str__(self):
+        return f"only {self.placed} of {self.count} blocks fit"
+
+def layout_capacity(gap, area):
+    # Most blocks the area could hold: corners of blocks at least min(block_sizes) + gap apart
+    # in x or y, packed on a lattice. Asking for more fails at once instead of after every restart.
+    left, bottom, right, top = area
+    size = min(block_sizes)
+    if right - left < size or top - bottom < size:
+        return 0
+    return ((right - left - size) // (size + gap) + 1) * ((top - bottom - size) // (size + gap) + 1)
+
+def grid_cells(x, y, size):
+    # Every grid cell touched by the square x .. x + size, y .. y + size
+    for column in range(x // grid_cell_size, (x + size) // grid_cell_size + 1):
+        for row in range(y // grid_cell_size, (y + size) // grid_cell_size + 1):
+            yield (column, row)
+
+def sweep_box(x0, y0, dx, dy, left, bottom, right, top):
+    # Time of impact of points moving from (x0, y0) by (dx, dy) with the open box
+    # left < x < right, bottom < y < top: the fraction of the move, in 0 .. 1, at which each
+    # first is inside, or inf if it never is. Works elementwise on arrays (slab test).
+    near_x, far_x = slab(x0, dx, left, right)
+    near_y, far_y = slab(y0, dy, bottom, top)
+    enter = np.maximum(np.maximum(near_x, near_y), 0.0)
+    leave = np.minimum(np.minimum(far_x, far_y), 1.0)
+    return np.where(enter < leave, enter, np.inf)
+
+def slab(start, delta, low, high):
+    # Fractions of the move at which one coordinate enters and leaves low .. high
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1 = (low - start) / delta
+        t2 = (high - start) / delta
+    near = np.minimum(t1, t2)
+    far = np.maximum(t1, t2)
+    still = delta == 0
+    if np.any(still):
+        inside = (low < start) & (start < high)
+        near = np.where(still, np.where(inside, -np.inf, np.inf), near)
+        far = np.where(still, np.where(inside, np.inf, -np.inf), far)
+    return near, far
+
+def sweep_circle(x0, y0, dx, dy, center_x, center_y, radius):
+    # Time of impact, as in sweep_box(), with the open circle around (center_x, center_y):
+    # the first root of |start + t * delta - center| = radius
+    fx = x0 - center_x
+    fy = y0 - center_y
+    a = dx * dx + dy * dy
+    b = fx * dx + fy * dy
+    c = fx * fx + fy * fy - radius * radius
+    discriminant = b * b - a * c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (-b - np.sqrt(np.maximum(discriminant, 0.0))) / a
+    hit = (discriminant > 0) & (t >= 0) & (t < 1)
+    return np.where(c < 0, 0.0, np.where(hit, t, np.inf))
+
+class Game:
+    # One game: score, lives, blocks, the entity pool, scheduled events, held keys and its own
+    # random source. Games share nothing but the module's settings, so any number can run
+    # side by side in one process.
+    def __init__(self, capacity=65536, rng=None):
+        self.rng = rng or random.Random()  # Random source, seeded by start_game() so a game replays exactly
+
+        # Game state
+        self.score = 0
+        self.lives = 3
+        self.game_over_lives = False
+        self.game_over_blocks = False
+        self.difficulty = None
+
+        # Stars
+        self.star_x = np.zeros(0)
+        self.star_y = np.zeros(0)
+        self.star_scroll = 0.0  # Distance the pattern has moved down, kept in 0 .. WINDOW_HEIGHT
+        self.prev_star_scroll = 0.0
+        self.stars_version = 0  # Bumped whenever the pattern is regenerated
+
+        # Spaceship
+        self.spaceship_x = WINDOW_WIDTH // 2
+        self.prev_spaceship_x = self.spaceship_x  # Position at the last collision check, the ship is swept from there
+        self.drawn_spaceship_x = self.spaceship_x  # Position before the latest tick's move, the renderer blends from it
+        self.invincible = False
+        self.invincible_start = 0  # tick_count when invincibility was picked up
+        self.three_way_shoot = False
+        self.three_way_shoot_start = 0  # tick_count when three-way shoot was picked up
+
+        # Input state: keys held down are applied once per tick by apply_input(), so movement
+        # and fire rate follow the tick rate instead of the OS key-repeat rate
+        self.held_left = False
+        self.held_right = False
+        self.held_fire = False
+        self.fire_queued = False  # A fire press not yet turned into a shot, so quick taps are not lost
+        self.fire_cooldown = 0  # Ticks until the next shot is allowed
+        self.input_pressed_at = None  # perf_counter() of the oldest key press no tick has applied yet
+        self.input_applied_at = None  # Press time of input applied by a tick but not yet shown on screen
+
+        # Blocks, and the endless mode field they scroll on
+        self.blocks = []
+        self.block_grid = {}  # (column, row) -> blocks overlapping that grid cell
+        self.blocks_version = 0  # Bumped on every block change so cached block layers know to redraw
+        self.endless = False
+        self.field_scroll = 0.0
+        self.prev_field_scroll = 0.0
+        self.field_top = 0  # Field y up to which waves have been laid out
+        self.waves = deque()  # (field y of the wave's top, its blocks), oldest first
+        self.wave_count = 0  # Waves laid out since the game started
+
+        self.entities = EntityPool(capacity)
+
+        # Timing
+        self.tick_count = 0  # Ticks run since start_game(); game time, so sessions replay exactly
+        self.tick_accumulator = 0.0
+        self.render_alpha = 1.0  # How far the current frame is between the previous and the latest tick
+
+        # Scheduled events: spawns and power-up expiries, kept in a heap of (tick, sequence, action)
+        # on game-time ticks, so a tick only pays for the events due in it and replays and pauses
+        # see them at the same ticks. The sequence number runs same-tick events in the order queued.
+        self.timers = []
+        self.timer_sequence = 0
+
+    def seed_rng(self, seed):
+        # Seed the random generator so a run can be reproduced
+        self.rng.seed(seed)
+
+    def start_game(self, selected_difficulty, seed):
+        # Start a session from a known seed, so it can be recorded and replayed (see replay.py)
+        self.difficulty = selected_difficulty
+        self.tick_count = 0
+        self.seed_rng(seed)
+        # restart_game() keeps these between games, a session must not inherit them
+        self.spaceship_x = self.prev_spaceship_x = self.drawn_spaceship_x = WINDOW_WIDTH // 2
+        self.invincible = False
+        self.release_keys()
+        self.restart_game()
+
+    def init_stars(self):
+        self.star_x = np.array([self.rng.randint(0, WINDOW_WIDTH) for _ in range(num_stars)], dtype=float)
+        self.star_y = np.array([self.rng.randint(0, WINDOW_HEIGHT) for _ in range(num_stars)], dtype=float)
+        self.star_scroll = self.prev_star_scroll = 0.0
+        self.stars_version += 1
+
+    def star_scroll_at(self, alpha=1.0):
+        # Scroll offset blended between the previous and the latest tick, across the wrap
+        delta = (self.star_scroll - self.prev_star_scroll) % WINDOW_HEIGHT
+        return (self.prev_star_scroll + delta * alpha) % WINDOW_HEIGHT
+
+    def star_positions(self, alpha=1.0):
+        return self.star_x, (self.star_y - self.star_scroll_at(alpha)) % WINDOW_HEIGHT
+
+    def init_game(self):
+        self.blocks = []
+        self.block_grid.clear()
+        self.blocks_version += 1
+        self.entities.clear()
+        self.init_stars()
+
+        # Initialize blocks with different sizes in the upper half of the window
+        if self.endless:
+            self.start_waves()
+            return
+        for block in self.layout_blocks():
+            self.add_block(block)
+
+    def start_waves(self):
+        self.field_scroll = self.prev_field_scroll = 0.0
+        self.field_top = WINDOW_HEIGHT // 2
+        self.waves.clear()
+        self.wave_count = 0
+        self.stream_blocks()
+
+    def stream_blocks(self):
+        # Lay out waves before they scroll into view and free the ones that have scrolled out of it,
+        # so only about three screens of blocks exist however long the game runs
+        while self.field_top < self.field_scroll + WINDOW_HEIGHT + wave_height:
+            # Keep block_gap free below the next wave, as between blocks of one wave
+            area = (0, self.field_top, WINDOW_WIDTH, self.field_top + wave_height - block_gap)
+            wave_blocks = self.layout_blocks(wave_block_count, area=area)
+            for block in wave_blocks:
+                self.add_block(block)
+            self.field_top += wave_height
+            self.wave_count += 1
+            self.waves.append((self.field_top, wave_blocks))
+
+        blocks = self.blocks
+        while self.waves and self.waves[0][0] <= self.field_scroll:
+            for block in self.waves.popleft()[1]:
+                if block['index'] < len(blocks) and blocks[block['index']] is block:  # Not shot already
+                    self.remove_block(block)
+
+    def field_scroll_at(self, alpha=1.0):
+        return self.prev_field_scroll + (self.field_scroll - self.prev_field_scroll) * alpha
+
+    def spaceship_x_at(self, alpha=1.0):
+        # prev_spaceship_x cannot serve here, check_collisions() catches it up within the tick
+        return self.drawn_spaceship_x + (self.spaceship_x - self.drawn_spaceship_x) * alpha
+
+    def layout_blocks(self, count=None, gap=None, area=None, attempts=None):
+        # Random block positions at least gap apart, as (x, y, size) dicts inside
+        # area = (left, bottom, right, top), by default the upper half of the window.
+        # Positions are drawn uniformly over the area and checked against a grid of the
+        # placed blocks, so each check is O(1). A block that finds no room in attempts
+        # draws is placed beside an already placed block instead (Poisson-disc style);
+        # a placed block whose surroundings fail attempts draws is never tried again.
+        # That bounds the whole layout to 2 * attempts * count draws. Only when every
+        # placed block has been ruled out is the area searched exhaustively (areas up to
+        # layout_scan_limit). Early blocks can still be spread so that the rest find no room
+        # in an area that holds them all, then the layout starts over, up to layout_restarts
+        # times; LayoutError is raised if none fits or count is above layout_capacity().
+        count = block_count if count is None else count
+        gap = block_gap if gap is None else gap
+        attempts = layout_attempts if attempts is None else attempts
+        area = area or (0, WINDOW_HEIGHT // 2, WINDOW_WIDTH, WINDOW_HEIGHT)
+        if count > layout_capacity(gap, area):
+            raise LayoutError(0, count)
+        most = 0
+        for _ in range(layout_restarts + 1):
+            placed = self.place_blocks(count, gap, area, attempts)
+            if len(placed) == count:
+                return placed
+            most = max(most, len(placed))
+        raise LayoutError(most, count)
+
+    def place_blocks(self, count, gap, area, attempts):
+        # One layout attempt for layout_blocks(); stops early at a block that finds no room
+        left, bottom, right, top = area
+        rng = self.rng
+        cell = max(block_sizes) + gap  # Blocks closer than this are in neighbouring cells
+        grid = {}  # (column, row) of a block's corner -> corners of the blocks there
+        placed = []
+        active = []  # Corners of placed blocks that may still have room around them
+
+        def fits(x, y, size):
+            column = x // cell
+            row = y // cell
+            reach = size + gap
+            for c in (column - 1, column, column + 1):
+                for r in (row - 1, row, row + 1):
+                    for block_x, block_y in grid.get((c, r), ()):
+                        if -reach < block_x - x < reach and -reach < block_y - y < reach:
+                            return False
+            return True
+
+        for _ in range(count):
+            block_size = rng.choice(block_sizes)
+            position = None
+            for _ in range(attempts):
+                block_x = rng.randint(left, right - block_size)
+                block_y = rng.randint(bottom, top - block_size)
+                if fits(block_x, block_y, block_size):
+                    position = (block_x, block_y)
+                    break
+
+            while position is None and active:
+                i = rng.randrange(len(active))
+                active_x, active_y = active[i]
+                for _ in range(attempts):
+                    # Somewhere between one and two cells away from the active block
+                    block_x = active_x + rng.randint(-2 * cell, 2 * cell)
+                    block_y = active_y + rng.randint(-2 * cell, 2 * cell)
+                    if (left <= block_x <= right - block_size and bottom <= block_y <= top - block_size and
+                            max(abs(block_x - active_x), abs(block_y - active_y)) >= cell and
+                            fits(block_x, block_y, block_size)):
+                        position = (block_x, block_y)
+                        break
+                else:
+                    active[i] = active[-1]
+                    active.pop()
+
+            if position is None and (right - left) * (top - bottom) <= layout_scan_limit:
+                position = self.free_corner(placed, block_size, gap, (left, bottom, right, top))
+            if position is None:
+                break
+            grid.setdefault((position[0] // cell, position[1] // cell), []).append(position)
+            active.append(position)
+            placed.append({'x': position[0], 'y': position[1], 'size': block_size})
+        return placed
+
+    def free_corner(self, placed, size, gap, area):
+        # A random corner where a block of this size fits, found by clearing every corner
+        # the placed blocks rule out from a raster of the area; None if there is none
+        left, bottom, right, top = area
+        free = np.ones((top - size - bottom + 1, right - size - left + 1), dtype=bool)  # [y, x]
+        reach = size + gap
+        for block in placed:
+            x = block['x'] - left
+            y = block['y'] - bottom
+            free[max(y - reach + 1, 0):max(y + reach, 0), max(x - reach + 1, 0):max(x + reach, 0)] = False
+        ys, xs = np.nonzero(free)
+        if len(xs) == 0:
+            return None
+        i = self.rng.randrange(len(xs))
+        return (int(xs[i]) + left, int(ys[i]) + bottom)
+
+    def add_block(self, block):
+        self.blocks_version += 1
+        block['index'] = len(self.blocks)
+        self.blocks.append(block)
+        for cell in grid_cells(block['x'], block['y'], block['size']):
+            self.block_grid.setdefault(cell, []).append(block)
+
+    def remove_block(self, block):
+        # Swap the last block into the freed slot so the list never shifts
+        self.blocks_version += 1
+        blocks = self.blocks
+        last = blocks.pop()
+        if last is not block:
+            blocks[block['index']] = last
+            last['index'] = block['index']
+        for cell in grid_cells(block['x'], block['y'], block['size']):
+            cell_blocks = self.block_grid[cell]
+            cell_blocks.remove(block)
+            if not cell_blocks:
+                del self.block_grid[cell]
+
+    def blocks_in_cells(self, first_column, last_column, first_row, last_row):
+        # Blocks overlapping a range of grid cells, each once
+        found = {}
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                for block in self.block_grid.get((column, row), ()):
+                    found[id(block)] = block
+        return found.values()
+
+    def check_collisions(self):
+        entities = self.entities
+
+        # Check bullet-block collisions along each bullet's path this tick, only against blocks
+        # in the grid cells the path crossed. Blocks are in field coordinates, which only differ
+        # from the screen's in endless mode, where the field also moved during the tick.
+        if self.blocks:
+            block_grid = self.block_grid
+            bullets = entities.indices(BULLET)
+            x1 = entities.x[bullets]
+            y1 = entities.y[bullets] + self.field_scroll
+            if swept_collisions:
+                x0 = entities.prev_x[bullets]
+                y0 = entities.prev_y[bullets] + self.prev_field_scroll
+                # Only the part of the path below the top of the screen counts, blocks above it cannot be shot
+                screen_y0 = entities.prev_y[bullets]
+                screen_y1 = entities.y[bullets]
+                leaving = screen_y1 > WINDOW_HEIGHT
+                if leaving.any():
+                    fraction = np.where(leaving, (WINDOW_HEIGHT - screen_y0) / np.where(leaving, screen_y1 - screen_y0, 1.0), 1.0)
+                    x1 = x0 + (x1 - x0) * fraction
+                    y1 = y0 + (y1 - y0) * fraction
+            else:
+                x0, y0 = x1, y1
+            # Pair each path with the blocks its bounding box overlaps, only those get the exact test
+            pair_bullets = []
+            pair_blocks = []
+            for i, (from_x, from_y, to_x, to_y) in enumerate(zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist())):
+                low_x, high_x = (from_x, to_x) if from_x <= to_x else (to_x, from_x)
+                low_y, high_y = (from_y, to_y) if from_y <= to_y else (to_y, from_y)
+                first_column, last_column = int(low_x // grid_cell_size), int(high_x // grid_cell_size)
+                first_row, last_row = int(low_y // grid_cell_size), int(high_y // grid_cell_size)
+                if first_column == last_column and first_row == last_row:
+                    cell_blocks = block_grid.get((first_column, first_row), ())
+                else:
+                    cell_blocks = self.blocks_in_cells(first_column, last_column, first_row, last_row)
+                for block in cell_blocks:
+                    if (block['x'] < high_x and low_x < block['x'] + block['size'] and
+                        block['y'] < high_y and low_y < block['y'] + block['size']):
+                        pair_bullets.append(i)
+                        pair_blocks.append(block)
+            if pair_blocks:
+                pair_bullets = np.array(pair_bullets)
+                left, bottom, size = np.array([(block['x'], block['y'], block['size']) for block in pair_blocks], dtype=float).T
+                start_x = x0[pair_bullets]
+                start_y = y0[pair_bullets]
+                impact = sweep_box(start_x, start_y, x1[pair_bullets] - start_x, y1[pair_bullets] - start_y,
+                                   left, bottom, left + size, bottom + size)
+                # Resolve hits in the order they happened, so when two bullets reach one block in
+                # the same tick the first one takes it and the other flies on
+                hit_bullets = []
+                taken = set()
+                for pair in np.argsort(impact, kind="stable").tolist():
+                    if impact[pair] == np.inf:
+                        break
+                    bullet = int(bullets[pair_bullets[pair]])
+                    block = pair_blocks[pair]
+                    if bullet in hit_bullets or id(block) in taken:
+                        continue
+                    self.remove_block(block)
+                    taken.add(id(block))
+                    hit_bullets.append(bullet)
+                    self.score += 1  # Increase score when hitting blocks
+                    if not self.blocks and not self.endless:
+                        self.game_over_blocks = True
+                if hit_bullets:
+                    entities.kill(hit_bullets)
+
+        # Check what met the spaceship: one pass finds the few entities near it, only those are tested exactly
+        rows, kinds, box_impact = self.near_spaceship()
+        if len(rows):
+            # Spaceship-heart collisions
+            hearts = rows[(kinds == HEART) & (box_impact < np.inf)]
+            entities.kill(hearts)
+            self.lives += len(hearts)  # Increase lives when collecting hearts
+
+            # Spaceship-power-up collisions
+            power_ups = rows[(kinds == POWER_UP) & (box_impact < np.inf)]
+            entities.kill(power_ups)
+            for _ in range(len(power_ups)):
+                self.apply_power_up()
+
+            # Spaceship-arrow collisions, against the shield when invincible
+            arrows = kinds == ARROW
+            if self.invincible:
+                entities.kill(rows[arrows & (self.shield_impact(rows) < np.inf)])
+            else:
+                arrows = rows[arrows & (box_impact < np.inf)]
+                entities.kill(arrows)
+                self.lives -= len(arrows)
+                if self.lives <= 0:
+                    self.game_over_lives = True
+        self.prev_spaceship_x = self.spaceship_x
+
+    def spaceship_paths(self, rows):
+        # Where entities started the tick and how far they moved, relative to the spaceship, which
+        # moved too. With swept_collisions off the paths have no length.
+        entities = self.entities
+        if not swept_collisions:
+            return entities.x[rows] - self.spaceship_x, entities.y[rows], 0.0, 0.0
+        x0 = entities.prev_x[rows] - self.prev_spaceship_x
+        y0 = entities.prev_y[rows]
+        return x0, y0, entities.x[rows] - self.spaceship_x - x0, entities.y[rows] - y0
+
+    def near_spaceship(self):
+        # Live falling entities whose path this tick overlaps the area the spaceship and its shield
+        # (a circle of radius spaceship_width) swept, found with a bounding-box pass in scratch
+        # buffers; returns their rows, their kinds and when each met the spaceship's box
+        entities = self.entities
+        spaceship_x = self.spaceship_x
+        n = entities.used
+        x = entities.x[:n]
+        y = entities.y[:n]
+        start_x, start_y, ship_start = (entities.prev_x[:n], entities.prev_y[:n], self.prev_spaceship_x) if swept_collisions else (x, y, spaceship_x)
+        center_x = spaceship_width // 2
+        center_y = spaceship_y + spaceship_height // 2
+        left = min(ship_start, spaceship_x) + center_x - spaceship_width
+        right = max(ship_start, spaceship_x) + center_x + spaceship_width
+        bottom = min(spaceship_y, center_y - spaceship_width)
+        top = max(spaceship_y + spaceship_height, center_y + spaceship_width)
+
+        near = np.not_equal(entities.kind[:n], BULLET, out=entities.mask[:n])
+        np.logical_and(near, entities.alive[:n], out=near)
+        test = entities.mask2[:n]
+        low = entities.scratch[:n]
+        high = entities.scratch2[:n]
+        np.logical_and(near, np.less(np.minimum(start_x, x, out=low), right, out=test), out=near)
+        np.logical_and(near, np.greater(np.maximum(start_x, x, out=high), left, out=test), out=near)
+        np.logical_and(near, np.less(np.minimum(start_y, y, out=low), top, out=test), out=near)
+        np.logical_and(near, np.greater(np.maximum(start_y, y, out=high), bottom, out=test), out=near)
+        rows = np.flatnonzero(near)
+        if len(rows) == 0:
+            return rows, rows, rows
+        impact = sweep_box(*self.spaceship_paths(rows), 0, spaceship_y, spaceship_width, spaceship_y + spaceship_height)
+        return rows, entities.kind[rows], impact
+
+    def shield_impact(self, rows):
+        # When each entity met the shield around the spaceship's center
+        return sweep_circle(*self.spaceship_paths(rows), spaceship_width // 2, spaceship_y + spaceship_height // 2, spaceship_width)
+
+    def restart_game(self):
+        self.score = 0
+        self.lives = 3
+        self.game_over_lives = False
+        self.game_over_blocks = False
+        self.three_way_shoot = False
+        self.three_way_shoot_start = 0
+        self.init_game()
+        self.start_timers()
+
+    def schedule(self, tick, action):
+        # Run action() during tick, see run_timers()
+        self.timer_sequence += 1
+        heapq.heappush(self.timers, (tick, self.timer_sequence, action))
+
+    def run_timers(self):
+        timers = self.timers
+        while timers and timers[0][0] <= self.tick_count:
+            heapq.heappop(timers)[2]()
+
+    def start_timers(self):
+        # Queue the first spawn of each spawner for a new game. Invincibility outlives a
+        # restart, so its expiry is queued again.
+        self.timers.clear()
+        settings = difficulty_settings[self.difficulty]
+        self.start_spawner(self.spawn_falling_hearts, settings["heart_spawn_rate"])
+        self.start_spawner(self.spawn_falling_arrows, settings["arrow_spawn_rate"])
+        self.start_spawner(self.spawn_power_ups, power_up_spawn_rate)
+        if self.invincible:
+            self.schedule(self.invincible_start + power_up_ticks(), self.end_invincible)
+
+    def start_spawner(self, spawn, rate):
+        # Call spawn() at random ticks, with the statistics of a rate chance drawn every tick at
+        # BASE_TICK_RATE: the wait for the next spawn is drawn from the geometric distribution
+        # of the tick_chance() trials instead of one draw per tick
+        chance = tick_chance(rate)
+        if chance <= 0:
+            return
+
+        def next_spawn():
+            if chance >= 1:
+                return self.tick_count + 1
+            return self.tick_count + 1 + int(math.log(1.0 - self.rng.random()) / math.log(1.0 - chance))
+
+        def fire():
+            spawn()
+            self.schedule(next_spawn(), fire)
+        self.schedule(next_spawn(), fire)
+
+    def end_three_way_shoot(self):
+        # Picking the power-up up again restarts it, an expiry queued by the earlier pickup is stale then
+        if self.tick_count - self.three_way_shoot_start >= power_up_ticks():
+            self.three_way_shoot = False
+
+    def end_invincible(self):
+        if self.tick_count - self.invincible_start >= power_up_ticks():
+            self.invincible = False
+
+    def update_game_objects(self):
+        self.tick_count += 1
+
+        # The starfield moves as a whole, only its offset changes
+        self.prev_star_scroll = self.star_scroll
+        self.star_scroll = (self.star_scroll + star_speed * tick_scale) % WINDOW_HEIGHT
+
+        if self.endless:
+            self.prev_field_scroll = self.field_scroll
+            self.field_scroll += field_speed * tick_scale
+            self.stream_blocks()
+
+        # Move every entity at once, velocities are set when each one spawns.
+        # Only rows below the high-water mark are touched, and every result goes into
+        # preallocated buffers, so this allocates nothing however many entities are alive.
+        entities = self.entities
+        n = entities.used
+        x = entities.x[:n]
+        y = entities.y[:n]
+        np.copyto(entities.prev_x[:n], x)
+        np.copyto(entities.prev_y[:n], y)
+        np.add(x, entities.vx[:n], out=x)
+        np.add(y, entities.vy[:n], out=y)
+
+        # Remove off-screen objects: bullets above the top, falling objects below the bottom.
+        # Bullets go a tick after they leave, check_collisions() still tests the move that took them out.
+        bullets = entities.select(BULLET, entities.mask)
+        above = np.logical_and(bullets, np.greater_equal(entities.prev_y[:n], WINDOW_HEIGHT, out=entities.mask2[:n]), out=entities.mask2[:n])
+        falling = np.logical_xor(entities.alive[:n], bullets, out=bullets)
+        below = np.logical_and(falling, np.less_equal(y, 0, out=entities.mask3[:n]), out=entities.mask3[:n])
+        entities.kill_mask(np.logical_or(above, below, out=above))
+
+    def spawn_falling_hearts(self):
+        self.entities.spawn(HEART, self.rng.randint(0, WINDOW_WIDTH), WINDOW_HEIGHT, 0,
+                            -difficulty_settings[self.difficulty]["heart_speed"] * tick_scale)
+
+    def spawn_falling_arrows(self):
+        self.entities.spawn(ARROW, self.rng.randint(0, WINDOW_WIDTH), WINDOW_HEIGHT, 0,
+                            -difficulty_settings[self.difficulty]["arrow_speed"] * tick_scale)
+
+    def spawn_power_ups(self):
+        self.entities.spawn(POWER_UP, self.rng.randint(0, WINDOW_WIDTH), WINDOW_HEIGHT, 0, -power_up_speed * tick_scale)
+
+    def check_game_over(self):
+        if self.lives <= 0:
+            self.game_over_lives = True
+
+        if not self.blocks and not self.endless:
+            self.game_over_blocks = True
+
+    def apply_power_up(self):
+        power_up = self.rng.choice(["three_way_shoot", "invincible"])
+        if power_up == "three_way_shoot":
+            self.three_way_shoot = True
+            self.three_way_shoot_start = self.tick_count
+            self.schedule(self.tick_count + power_up_ticks(), self.end_three_way_shoot)
+        elif power_up == "invincible":
+            self.invincible = True
+            self.invincible_start = self.tick_count
+            self.schedule(self.tick_count + power_up_ticks(), self.end_invincible)
+
+    def shoot_bullet(self):
+        angles = (0, -15, 15) if self.three_way_shoot else (0,)
+        for angle in angles:
+            # A bullet's direction never changes, so its velocity is computed once here
+            angle_rad = math.radians(angle)
+            speed = bullet_speed * tick_scale
+            self.entities.spawn(BULLET, self.spaceship_x + spaceship_width // 2, spaceship_y + spaceship_height,
+                                math.sin(angle_rad) * speed, math.cos(angle_rad) * speed)
+
+    def move_spaceship(self, direction, speed=spaceship_speed):
+        # direction is -1 for left, 1 for right
+        if direction < 0 and self.spaceship_x > 0:
+            self.spaceship_x -= speed
+        elif direction > 0 and self.spaceship_x < WINDOW_WIDTH - spaceship_width:
+            self.spaceship_x += speed
+
+    def set_key(self, action, down):
+        # Record a key going down or up; action is "left", "right" or "fire"
+        if action == "left":
+            self.held_left = down
+        elif action == "right":
+            self.held_right = down
+        elif action == "fire":
+            self.held_fire = down
+            self.fire_queued = self.fire_queued or down
+        if down and self.input_pressed_at is None:
+            self.input_pressed_at = time.perf_counter()
+
+    def release_keys(self):
+        self.held_left = self.held_right = self.held_fire = self.fire_queued = False
+        self.fire_cooldown = 0
+        self.input_pressed_at = self.input_applied_at = None
+
+    def apply_input(self):
+        # Turn the held keys into one tick of movement and at most one shot
+        self.drawn_spaceship_x = self.spaceship_x
+        direction = self.held_right - self.held_left
+        if direction:
+            self.move_spaceship(direction, max(1, round(spaceship_hold_speed * tick_scale)))
+
+        if self.fire_cooldown:
+            self.fire_cooldown -= 1
+        if (self.held_fire or self.fire_queued) and not self.fire_cooldown:
+            self.shoot_bullet()
+            self.fire_queued = False
+            self.fire_cooldown = max(1, round(fire_interval * tick_rate))
+
+        # Hand the press time to the renderer, which stops the latency clock once the frame is shown
+        if self.input_pressed_at is not None:
+            if self.input_applied_at is None:
+                self.input_applied_at = self.input_pressed_at
+            self.input_pressed_at = None
+
+    def spawn_objects(self):
+        # Spawns and power-up expiries due this tick; a tick with none due costs one look at the heap
+        self.run_timers()
+
+    def step_game(self):
+        # Advance the simulation by exactly one fixed tick
+        with profiler.phase("update"):
+            self.apply_input()
+            self.update_game_objects()
+        with profiler.phase("spawn"):
+            self.spawn_objects()
+        with profiler.phase("collide"):
+            self.check_collisions()
+            self.check_game_over()
+
+    def advance_simulation(self, elapsed):
+        # Run as many whole ticks as the elapsed real time covers, keep the remainder
+        tick_length = 1.0 / tick_rate
+        self.tick_accumulator += elapsed
+        ticks = 0
+        while self.tick_accumulator >= tick_length and not (self.game_over_lives or self.game_over_blocks):
+            if ticks == max_ticks_per_frame:
+                self.tick_accumulator = 0.0
+                break
+            self.step_game()
+            self.tick_accumulator -= tick_length
+            ticks += 1
+        self.render_alpha = self.tick_accumulator / tick_length
+
+# The default game, played by the window, headless runs, batch workers and replays. It draws
+# from the random module itself, so seeding either one reproduces a game. Its state is read
+# and set as sim.game.<name>; the functions below run it.
+game = Game(rng=random)
+
+def seed_rng(seed):
+    game.seed_rng(seed)
+
+def start_game(selected_difficulty, seed):
+    game.start_game(selected_difficulty, seed)
+
+def restart_game():
+    game.restart_game()
+
+def init_game():
+    game.init_game()
+
+def layout_blocks(count=None, gap=None, area=None, attempts=None):
+    return game.layout_blocks(count, gap, area, attempts)
+
+def star_scroll_at(alpha=1.0):
+    return game.star_scroll_at(alpha)
+
+def star_positions(alpha=1.0):
+    return game.star_positions(alpha)
+
+def field_scroll_at(alpha=1.0):
+    return game.field_scroll_at(alpha)
+
+def spaceship_x_at(alpha=1.0):
+    return game.spaceship_x_at(alpha)
+
+def update_game_objects():
+    game.update_game_objects()
+
+def spawn_objects():
+    game.spawn_objects()
+
+def spawn_falling_hearts():
+    game.spawn_falling_hearts()
+
+def spawn_falling_arrows():
+    game.spawn_falling_arrows()
+
+def spawn_power_ups():
+    game.spawn_power_ups()
+
+def check_collisions():
+    game.check_collisions()
+
+def check_game_over():
+    game.check_game_over()
+
+def shoot_bullet():
+    game.shoot_bullet()
+
+def move_spaceship(direction, speed=spaceship_speed):
+    game.move_spaceship(direction, speed)
+
+def set_key(action, down):
+    game.set_key(action, down)
+
+def release_keys():
+    game.release_keys()
+
+def apply_input():
+    game.apply_input()
+
+def step_game():
+    game.step_game()
+
+def advance_simulation(elapsed):
+    game.advance_simulation(elapsed)
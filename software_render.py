@@ -0,0 +1,98 @@
+# Software rasterizer: draws the renderer's point and quad batches into a NumPy RGB
+# framebuffer, so frames can be rendered without a GPU or a display and compared
+# pixel for pixel. Imports no OpenGL.
+#
+# Coordinates are the game's GL ones (origin at the bottom left, one unit per pixel)
+# and follow GL's rules for 1-pixel points and filled rectangles, so a frame matches
+# what the GL backend draws apart from text, which needs GLUT's bitmap fonts.
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def rgb8(color):
+    return np.array([round(channel * 255) for channel in color], dtype=np.uint8)
+
+class Framebuffer:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = np.zeros((height, width, 3), dtype=np.uint8)  # Row 0 is the top, as in image files
+
+    def clear(self, color=(0.0, 0.0, 0.0)):
+        self.pixels[:] = rgb8(color)
+
+    def points(self, color, xy):
+        # xy is an N x 2 array; a point covers the pixel its coordinates fall in.
+        # One scatter write for all of them, points outside the frame are dropped.
+        x = np.floor(xy[:, 0]).astype(np.intp)
+        y = np.floor(xy[:, 1]).astype(np.intp)
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        self.pixels[self.height - 1 - y[inside], x[inside]] = rgb8(color)
+
+    def quads(self, color, corners):
+        # corners is N x 8, the four x, y corners of each axis-aligned rectangle as fill_rect
+        # queues them. Pixels whose centers lie inside are filled, as GL does.
+        rgb = rgb8(color)
+        xs = corners[:, 0::2]
+        ys = corners[:, 1::2]
+        x0 = np.clip(np.ceil(xs.min(axis=1) - 0.5), 0, self.width).astype(np.intp)
+        x1 = np.clip(np.ceil(xs.max(axis=1) - 0.5), 0, self.width).astype(np.intp)
+        y0 = np.clip(np.ceil(ys.min(axis=1) - 0.5), 0, self.height).astype(np.intp)
+        y1 = np.clip(np.ceil(ys.max(axis=1) - 0.5), 0, self.height).astype(np.intp)
+        for left, right, bottom, top in zip(x0.tolist(), x1.tolist(), y0.tolist(), y1.tolist()):
+            self.pixels[self.height - top:self.height - bottom, left:right] = rgb
+
+def write_png(path, pixels):
+    # 8-bit RGB PNG, every row unfiltered
+    height, width, _ = pixels.shape
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, -1)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    with open(path, "wb") as f:
+        f.write(PNG_SIGNATURE)
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 1)))
+        f.write(chunk(b"IEND", b""))
+
+def read_png(path):
+    # Reads the PNGs write_png produces (8-bit RGB, unfiltered rows), which is all the references are
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError(f"{path} is not a PNG")
+    offset = len(PNG_SIGNATURE)
+    header = None
+    compressed = []
+    while offset < len(data):
+        length, kind = struct.unpack_from(">I4s", data, offset)
+        body = data[offset + 8:offset + 8 + length]
+        offset += length + 12
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b"IDAT":
+            compressed.append(body)
+    width, height, depth, color_type, _, _, interlace = header
+    if depth != 8 or color_type != 2 or interlace:
+        raise ValueError(f"{path}: only 8-bit RGB PNGs are supported")
+    rows = np.frombuffer(zlib.decompress(b"".join(compressed)), dtype=np.uint8).reshape(height, width * 3 + 1)
+    if rows[:, 0].any():
+        raise ValueError(f"{path}: only unfiltered PNGs are supported")
+    return rows[:, 1:].reshape(height, width, 3).copy()
+
+def write_raw(path, pixels):
+    # Bare RGB bytes, top row first; the size goes in the file name
+    with open(path, "wb") as f:
+        f.write(pixels.tobytes())
+
+def diff_image(expected, actual):
+    # Differing pixels in red over a dimmed copy of the expected image, and how many there are
+    different = (expected != actual).any(axis=2)
+    image = expected // 3
+    image[different] = (255, 0, 0)
+    return image, int(np.count_nonzero(different))